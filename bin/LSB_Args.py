@@ -1,17 +1,18 @@
 import argparse
 import os
-import imghdr
 
+from LSB_Preflight import PAYLOADS, check_capacity, image_info
 
-def check_args(encoding=False):
-    args = _build_parser(encoding)
+
+def check_args(encoding=False, argv=None):
+    args = _build_parser(encoding, argv)
     return args
 
 
 # Argument Parsers & Verifiers---------------------------------------------
 
-def _build_parser(encoding):
-    """ Build Parser to verify and accept user-defined arguments """
+def _build_parser(encoding, argv=None):
+    """ Build Parser to verify and accept user-defined arguments. Parses sys.argv unless argv is given """
     if encoding:
         parser = argparse.ArgumentParser(description="LSB Steganography App - Encoding")
         required_args = parser.add_argument_group('Required Arguments')
@@ -37,8 +38,29 @@ def _build_parser(encoding):
                                                                                    "file that will be outputted with "
                                                                                    "the "
                                                                                    "hidden data i.e. Output.bmp")
-        args = parser.parse_args()
-        return args if _check_size(args.cover, args.secret) else False
+        _add_optional_args(parser)
+        parser.add_argument('--bits', type=_bits_per_channel, default=1, help="Low bits of each cover channel "
+                                                                              "the secret is written into (1-4). "
+                                                                              "More bits need fewer cover pixels")
+        parser.add_argument('--payload', choices=PAYLOADS, default='rgb', help="Embed the secret's pixels as RGB "
+                                                                              "(default), in its own mode (native, "
+                                                                              "i.e. 1 byte per grayscale pixel) or "
+                                                                              "its file bytes as stored (file)")
+        parser.add_argument('--compress', choices=['zlib', 'lzma'], default=None, help="Compress the payload before "
+                                                                                      "embedding it")
+        parser.add_argument('--level', type=_compression_level, default=6, help="Compression level (0-9)")
+        output_args = parser.add_argument_group('Output Arguments')
+        output_args.add_argument('--png-level', type=_compression_level, default=None, help="Deflate level of .png "
+                                                                                            "output, 1 is fastest, 9 "
+                                                                                            "smallest")
+        output_args.add_argument('--png-filter', choices=['none', 'sub', 'up', 'average', 'paeth', 'adaptive'],
+                                 default=None, help="PNG row filter of .png output (adaptive is usually smallest)")
+        output_args.add_argument('--verify-output', action='store_true', help="Read the output back and check the "
+                                                                              "embedded pixels survived")
+        args = parser.parse_args(argv)
+        if args.compress:                                 # Its size is only known once compressed, encoder checks it
+            return args
+        return args if _check_size(args.cover, args.secret, args.bits, args.payload, args.key is not None) else False
 
     parser = argparse.ArgumentParser(description="LSB Steganography App - Decoding")
     required_args = parser.add_argument_group('Required Arguments')
@@ -54,23 +76,161 @@ def _build_parser(encoding):
                                                                                "file that will be outputted with "
                                                                                "the extracted "
                                                                                "hidden data i.e. Output.bmp")
-    args = parser.parse_args()
+    _add_optional_args(parser)
+    args = parser.parse_args(argv)
     return args
 
 
+def _add_optional_args(parser):
+    optional_args = parser.add_argument_group('Optional Arguments')
+    optional_args.add_argument('--strip-height', type=_positive_int, default=None, help="Stream the image in strips "
+                                                                                         "of this many rows instead "
+                                                                                         "of decoding it whole "
+                                                                                         "(for very large images)")
+    optional_args.add_argument('--key', type=str, default=None, help="Encrypt the payload with this key and scatter "
+                                                                     "it over the cover (encoding), the same key is "
+                                                                     "needed to decode it")
+    optional_args.add_argument('--workers', type=_positive_int, default=1, help="Threads the embedding/extraction "
+                                                                               "is split across, the output is the "
+                                                                               "same for any number")
+
+
+def check_batch_args(argv):
+    """ Build Parser for the non-interactive batch subcommand """
+    parser = argparse.ArgumentParser(prog="LSB_Main.py batch", description="LSB Steganography App - Batch")
+    parser.add_argument('manifest', type=_validate_manifest, help="CSV or JSONL manifest of encode/decode jobs")
+    parser.add_argument('-w', '--workers', type=_positive_int, default=None, help="Number of worker processes "
+                                                                                  "(defaults to the CPU count)")
+    parser.add_argument('--summary', type=str, default=None, help="Optional JSON file the batch summary is "
+                                                                  "written to")
+    return parser.parse_args(argv)
+
+
+def check_serve_args(argv):
+    """ Build Parser for the serve subcommand (local stego service) """
+    parser = argparse.ArgumentParser(prog="LSB_Main.py serve", description="LSB Steganography App - Service")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to listen on (defaults to localhost only)")
+    parser.add_argument('--port', type=_positive_int, default=8765, help="TCP port to listen on")
+    parser.add_argument('--unix', type=str, default=None, help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument('-w', '--workers', type=_positive_int, default=None, help="Number of worker processes "
+                                                                                  "(defaults to the CPU count)")
+    parser.add_argument('--queue-limit', type=_non_negative_int, default=8, help="Requests that may wait for a "
+                                                                                 "worker before new ones are "
+                                                                                 "refused with 503")
+    return parser.parse_args(argv)
+
+
+def check_scan_args(argv):
+    """ Build Parser for the scan subcommand (bulk payload detection) """
+    parser = argparse.ArgumentParser(prog="LSB_Main.py scan", description="LSB Steganography App - Scan")
+    parser.add_argument('targets', nargs='+', help="Image files and/or directories (searched recursively)")
+    parser.add_argument('-o', '--report', type=str, default=None, help="JSONL report file (defaults to stdout)")
+    parser.add_argument('-w', '--workers', type=_positive_int, default=None, help="Number of worker processes "
+                                                                                  "(defaults to the CPU count)")
+    parser.add_argument('--legacy-bytes', type=_non_negative_int, default=64 * 1024, help="Hidden bytes searched "
+                                                                                          "for a legacy trailer in "
+                                                                                          "images without a header")
+    return parser.parse_args(argv)
+
+
+def check_container_args(argv):
+    """ Build Parser for the container subcommand (multi-payload containers) """
+    parser = argparse.ArgumentParser(prog="LSB_Main.py container", description="LSB Steganography App - Container")
+    actions = parser.add_subparsers(dest='action', required=True)
+
+    create = actions.add_parser('create', help="Write an empty container into a copy of a cover image")
+    create.add_argument('-c', '--cover', required=True, type=_validate_file, help="Cover image (png or bmp)")
+    create.add_argument('-o', '--output', required=True, type=str, help="Container image that will be written")
+    create.add_argument('--slots', type=_positive_int, default=16, help="Number of payloads the container can hold")
+
+    add = actions.add_parser('add', help="Append a file to a container without touching the payloads in it")
+    add.add_argument('-f', '--stegofile', required=True, type=_validate_file, help="Container image")
+    add.add_argument('-i', '--input', required=True, type=_validate_payload, help="File to hide, of any type")
+    add.add_argument('-n', '--name', type=str, default=None, help="Name stored in the directory (defaults to the "
+                                                                  "file name)")
+    add.add_argument('-o', '--output', type=str, default=None, help="Write the result here instead of back into "
+                                                                    "the container image")
+    add.add_argument('--bits', type=_bits_per_channel, default=1, help="Low bits of each cover channel the file "
+                                                                       "is written into (1-4)")
+    add.add_argument('--key', type=str, default=None, help="Encrypt the file with this key")
+
+    listing = actions.add_parser('list', help="List the payloads of a container")
+    listing.add_argument('-f', '--stegofile', required=True, type=_validate_file, help="Container image")
+
+    extract = actions.add_parser('extract', help="Extract one payload, reading only its own bits")
+    extract.add_argument('-f', '--stegofile', required=True, type=_validate_file, help="Container image")
+    extract.add_argument('-n', '--name', required=True, type=str, help="Name of the payload to extract")
+    extract.add_argument('-o', '--output', required=True, type=str, help="File the payload is written to")
+    extract.add_argument('--key', type=str, default=None, help="Key the payload was added with")
+
+    for action in (create, add, extract):
+        action.add_argument('--workers', type=_positive_int, default=1, help="Threads the embedding/extraction "
+                                                                             "is split across")
+    return parser.parse_args(argv)
+
+
+def _validate_payload(file):
+    if not os.path.isfile(file):
+        raise argparse.ArgumentTypeError(f"File path of {file} cannot be found, or is not a file")
+    return file
+
+
+def _validate_manifest(file):
+    if not os.path.isfile(file):
+        raise argparse.ArgumentTypeError(f"Manifest {file} cannot be found, or is not a file")
+    if os.path.splitext(file)[1].lower() not in ['.csv', '.jsonl']:
+        raise argparse.ArgumentTypeError(f"Manifest {file} must be a .csv or .jsonl file")
+    return file
+
+
+def _positive_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a whole number")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"{value} must be 1 or greater")
+    return number
+
+
+def _non_negative_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a whole number")
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} must be 0 or greater")
+    return number
+
+
+def _bits_per_channel(value):
+    bits = _positive_int(value)
+    if bits > 4:
+        raise argparse.ArgumentTypeError(f"{value} bits per channel is not supported, choose 1 to 4")
+    return bits
+
+
+def _compression_level(value):
+    level = _non_negative_int(value)
+    if level > 9:
+        raise argparse.ArgumentTypeError(f"Compression level {value} is not supported, choose 0 to 9")
+    return level
+
+
 def _validate_file(file):
     try:
         if not os.path.isfile(file):
             raise argparse.ArgumentTypeError(f"File path of {file} cannot be found, or is not a file. "
                                              f"Please check the file path")
 
-        if imghdr.what(file) not in ['png', 'bmp']:
+        try:
+            image_format = image_info(file).format        # Only reads the header, which also proves it is readable
+        except ValueError:
+            image_format = None
+        if image_format not in ['png', 'bmp']:
             raise argparse.ArgumentTypeError(f"The file provided is not a valid image file. Image file must be a "
                                              f"png or bmp file")
-
-        with open(file, 'rb') as test_file:
-            test_file.read()
-            return file
+        return file
 
     except IOError:
         raise argparse.ArgumentTypeError(f"{file} was found, but the file is not readable. Check permissions")
@@ -79,22 +239,9 @@ def _validate_file(file):
                                          f"file type/extension.")
 
 
-def _extract_meta(secretimage):
-    secret_name, secret_ext = os.path.splitext(secretimage)
-    metadata = "###" + secret_name + secret_ext + "###"
-    metadata = metadata.encode('utf-8')
-    metadata = bin(int.from_bytes(metadata, 'big'))[2:]
-
-    if len(metadata) % 8 != 0:
-        padsize = 8 - (len(metadata) % 8)
-        metadata = ('0' * padsize) + metadata
-
-    return metadata
-
-
-def _check_size(coverimage, secretimage):
-    metadata = _extract_meta(secretimage)
-    return True if os.stat(coverimage).st_size > (os.stat(secretimage).st_size * 8) + (len(metadata) / 8) else False
+def _check_size(coverimage, secretimage, bits=1, payload='rgb', keyed=False):
+    """Compares the cover's pixel capacity with what the secret + stego header needs, from the image headers only"""
+    return check_capacity(coverimage, secretimage, bits, payload, keyed).fits
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+import mmap
+import os
+import shutil
+import struct
+import threading
+
+import numpy as np
+
+from LSB_Engine import channels_needed, check_segments, embed_scattered, embed_window, extract, extract_scattered, \
+    pack_values, run_parallel, scattered_values
+
+"""
+LSB_BMP.py
+
+Direct memory-mapped backend for uncompressed 24 bit (BI_RGB) BMPs. The pixel array of such a file sits at a known
+offset with rows padded to 4 bytes, stored bottom-up (or top-down for a negative height) in BGR order, so the LSBs
+can be read and patched in place without PIL decoding or re-encoding anything:
+
+  Encoding  copy the cover file to the output, map the copy and patch only the rows the payload covers
+  Decoding  map the stego file read-only, only the pages holding the header/payload rows are ever touched
+
+Callers address the image as the same flat RGB raster channel stream the rest of the engine uses, this module takes
+care of the row order, padding and BGR -> RGB mapping. Anything else is left to PIL (see is_fast_bmp).
+"""
+
+_FILE_HEADER = struct.Struct('<2sIHHI')
+_INFO_HEADER = struct.Struct('<IiiHHI')
+_ROWS_PER_BLOCK = 256
+
+
+def is_fast_bmp(path):
+    """True if path is an uncompressed 24 bit BI_RGB BMP that the mmap backend can handle"""
+    return _layout(path) is not None
+
+
+def _layout(path):
+    """Returns (pixel offset, width, height, top_down) or None for anything the fast path does not handle"""
+    try:
+        with open(path, 'rb') as bmp_file:
+            head = bmp_file.read(_FILE_HEADER.size + _INFO_HEADER.size)
+    except OSError:
+        return None
+    if len(head) < _FILE_HEADER.size + _INFO_HEADER.size:
+        return None
+
+    magic, _, _, _, offset = _FILE_HEADER.unpack_from(head)
+    dib_size, width, height, planes, bit_count, compression = _INFO_HEADER.unpack_from(head, _FILE_HEADER.size)
+    if magic != b'BM' or dib_size < 40 or planes != 1 or bit_count != 24 or compression != 0 or width <= 0 \
+            or height == 0:
+        return None
+    return offset, width, abs(height), height < 0
+
+
+# Classes ----------------------------
+
+class BMPImage:
+    def __init__(self, path, writable=False, workers=1):
+        """Memory-maps a BI_RGB 24 bit BMP. Use as a context manager. Blocks of rows are patched/read on a pool of
+        `workers` threads"""
+        layout = _layout(path)
+        if layout is None:
+            raise ValueError(f"{path} is not an uncompressed 24 bit BMP")
+        self.offset, self.width, self.height, self.top_down = layout
+        self.workers = workers
+        self.stride = (self.width * 3 + 3) & ~3
+        self.row_channels = self.width * 3
+
+        self._file = open(path, 'r+b' if writable else 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        if len(self._map) < self.offset + self.stride * self.height:
+            self.close()
+            raise ValueError(f"{path} is truncated, pixel data is incomplete")
+        self._rows = np.frombuffer(self._map, dtype=np.uint8, count=self.stride * self.height,
+                                   offset=self.offset).reshape(self.height, self.stride)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._rows = None                                 # Drop the array view before the map can be closed
+        self._map.close()
+        self._file.close()
+
+    @property
+    def size(self):
+        """Number of RGB channels in the image"""
+        return self.width * self.height * 3
+
+    def read_rows(self, top, bottom):
+        """Returns rows [top, bottom) (top-down) as a (rows, width, 3) RGB array copy"""
+        block = self._file_rows(top, bottom)[:, :self.row_channels]
+        return np.ascontiguousarray(block.reshape(-1, self.width, 3)[..., ::-1])
+
+    def write_rows(self, top, rgb):
+        """Writes a (rows, width, 3) RGB array back over rows starting at top"""
+        block = self._file_rows(top, top + rgb.shape[0])
+        block[:, :self.row_channels] = rgb[..., ::-1].reshape(rgb.shape[0], -1)
+
+    def _file_rows(self, top, bottom):
+        """View of the stored rows for image rows [top, bottom), flipped into top-down order for bottom-up files"""
+        if self.top_down:
+            return self._rows[top:bottom]
+        return self._rows[self.height - bottom:self.height - top][::-1]
+
+    def embed(self, payload, offset=0, bits=1, scatter=None):
+        """Embeds payload (uint8 array) at channel offset, patching only the rows it covers. Returns the next offset.
+        A scattered payload (see LSB_Engine.embed_scattered) patches every row of the scatter"""
+        end = check_segments([(payload, offset, bits, scatter)], self.size)
+
+        first_row = (scatter.first_pixel * 3 if scatter else offset) // self.row_channels
+        last_row = -(-end // self.row_channels)
+
+        def patch_block(top):                             # Blocks cover disjoint rows
+            rgb = self.read_rows(top, min(top + _ROWS_PER_BLOCK, last_row))
+            if scatter:
+                embed_scattered(rgb.reshape(-1), payload, top * self.row_channels, scatter, bits)
+            else:
+                embed_window(rgb.reshape(-1), payload, top * self.row_channels, offset, bits)
+            self.write_rows(top, rgb)
+
+        run_parallel(patch_block, range(first_row, last_row, _ROWS_PER_BLOCK), self.workers)
+        return end
+
+    def extract(self, nbytes, offset=0, bits=1, scatter=None):
+        """Same as LSB_Engine.extract, reading only the rows that hold the requested bits"""
+        end = offset + channels_needed(nbytes, bits)
+        if end > self.size:
+            raise ValueError(f"Cannot read {nbytes} bytes from offset {offset}, stego only has {self.size} channels")
+        if scatter:
+            return self._extract_scattered(nbytes, bits, scatter)
+
+        first_row, last_row = offset // self.row_channels, -(-end // self.row_channels)
+        channels = self.read_rows(first_row, last_row).reshape(-1)
+        return extract(channels, nbytes, offset - first_row * self.row_channels, bits, self.workers)
+
+    def _extract_scattered(self, nbytes, bits, scatter):
+        values = scattered_values(nbytes, bits, scatter)
+        first_row = scatter.first_pixel * 3 // self.row_channels
+        last_row = -(-scatter.end_pixel * 3 // self.row_channels)
+
+        def read_block(top):
+            rgb = self.read_rows(top, min(top + _ROWS_PER_BLOCK, last_row))
+            extract_scattered(rgb.reshape(-1), values, top * self.row_channels, scatter, bits)
+
+        run_parallel(read_block, range(first_row, last_row, _ROWS_PER_BLOCK), self.workers)
+        return pack_values(values, nbytes, bits, self.workers)
+
+
+def copy_and_patch(coverimage, outfile, segments, workers=1):
+    """Encodes by copying the cover BMP byte for byte and patching the LSBs into the copy in place. segments is a
+    list of LSB_Engine segments. The copy is patched under a temporary name next to outfile and only then moved over
+    it, so outfile may be the cover itself and is never left half patched"""
+    layout = _layout(coverimage)
+    if layout is None:
+        raise ValueError(f"{coverimage} is not an uncompressed 24 bit BMP")
+    check_segments(segments, layout[1] * layout[2] * 3)
+
+    partial = f"{outfile}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        shutil.copyfile(coverimage, partial)
+        with BMPImage(partial, writable=True, workers=workers) as stego:
+            for payload, offset, bits, scatter in segments:
+                stego.embed(payload, offset, bits, scatter)
+        os.replace(partial, outfile)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
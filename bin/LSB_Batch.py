@@ -0,0 +1,208 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+"""
+LSB_Batch.py
+
+Non-interactive batch mode. Runs the encode/decode jobs listed in a manifest across a process pool, reports every job
+as it finishes and returns a summary of throughput and failures. A failing job never stops the batch.
+
+Manifest formats (relative paths are resolved against the manifest's directory):
+  CSV    Header row with the columns: action,cover,secret,stegofile,output[,strip_height][,bits][,key][,payload][,compress]
+  JSONL  One object per line with the same keys, i.e.
+         {"action": "encode", "cover": "Cover.bmp", "secret": "Secret.bmp", "output": "Out.bmp"}
+         {"action": "decode", "stegofile": "Out.bmp", "output": "Restored.bmp"}
+
+Every worker keeps the covers it decoded in a LSB_Cache.CoverCache, so a cover shared by many encode jobs is only
+decoded once per worker.
+"""
+
+_PATH_FIELDS = {'encode': ['cover', 'secret', 'output'], 'decode': ['stegofile', 'output']}
+_MAX_ATTEMPTS = 2
+_IN_FLIGHT = 2                                            # Jobs queued per worker, bounds what a broken pool orphans
+_CACHE_BYTES = 256 * 1024 * 1024                          # Per worker process
+_cover_cache = None
+
+
+# Manifest---------------------------------------------
+
+def load_manifest(manifest):
+    """Reads a .csv or .jsonl manifest into a list of job dicts, numbered by their line in the manifest"""
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline='') as manifest_file:
+        if manifest.lower().endswith('.csv'):
+            rows = [(idex + 2, row) for idex, row in enumerate(csv.DictReader(manifest_file))]
+        else:
+            rows = [(idex + 1, line) for idex, line in enumerate(manifest_file) if line.strip()]
+
+    jobs = []
+    for line, row in rows:
+        job = _parse_row(row, base)
+        job['line'] = line
+        jobs.append(job)
+    return jobs
+
+
+def _parse_row(row, base):
+    """Turns one manifest row into a job dict. A row that cannot be a job becomes an {'error': ...} record, which
+    fails that job alone when it is run"""
+    try:
+        job = json.loads(row) if isinstance(row, str) else row
+    except json.JSONDecodeError as error:
+        return {'error': f"Invalid JSON: {error}"}
+    if not isinstance(job, dict):
+        return {'error': f"Expected a JSON object, got {type(job).__name__}"}
+
+    job = {key: value for key, value in job.items() if value not in (None, '')}
+    action = job.get('action')
+    for field in _PATH_FIELDS.get(action, []) if isinstance(action, str) else []:
+        if field not in job:
+            continue
+        if not isinstance(job[field], str):
+            return {'action': action, 'error': f"{field} must be a path string, got {type(job[field]).__name__}"}
+        job[field] = os.path.join(base, job[field])
+    return job
+
+
+# Running---------------------------------------------
+
+def run_batch(jobs, workers=None, report=print):
+    """Runs jobs on a pool of worker processes. report is called with each job result as it completes.
+    A worker that dies breaks the whole pool, so the jobs in flight at that point cannot tell which of them killed it.
+    They are run again one at a time in a single-worker pool, where a dying worker can only be the job's own, and
+    such a job is retried once in a fresh pool before being marked as failed. The rest of the batch carries on in a
+    new pool"""
+    start = time.perf_counter()
+    results = []
+    workers = workers or os.cpu_count() or 1
+    queue = deque(jobs)
+
+    def finish(result):
+        results.append(result)
+        report(result)
+
+    while queue:
+        orphaned = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            while (queue and not orphaned) or futures:
+                while queue and not orphaned and len(futures) < workers * _IN_FLIGHT:
+                    try:
+                        future = pool.submit(_run_job, queue[0])
+                    except BrokenProcessPool:
+                        break
+                    futures[future] = queue.popleft()
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = futures.pop(future)
+                    try:
+                        finish(future.result())
+                    except BrokenProcessPool:
+                        orphaned.append(job)
+        _run_isolated(orphaned, finish)
+
+    return _summarise(results, time.perf_counter() - start)
+
+
+def _run_isolated(jobs, finish):
+    """Runs jobs one at a time in a single-worker pool, counting a dying worker against the job it was running"""
+    attempts = {}
+    queue = deque(jobs)
+    while queue:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            while queue:
+                job = queue[0]
+                try:
+                    result = pool.submit(_run_job, job).result()
+                except BrokenProcessPool:
+                    attempts[job['line']] = attempts.get(job['line'], 0) + 1
+                    if attempts[job['line']] < _MAX_ATTEMPTS:
+                        break                             # Same job again, in a fresh pool
+                    result = _result(job, False, 0.0, error="Worker process died while running this job")
+                queue.popleft()
+                finish(result)
+
+
+def _run_job(job):
+    """Runs a single job in a worker process. Never raises, any failure is returned in the result"""
+    global _cover_cache
+    start = time.perf_counter()
+    try:
+        if 'error' in job:
+            raise ValueError(job['error'])
+        action = job.get('action')
+        if action not in _PATH_FIELDS:
+            raise ValueError(f"Unknown action {action!r}, expected encode or decode")
+        missing = [field for field in _PATH_FIELDS[action] if field not in job]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)} for {action} job")
+
+        from LSB_Image import encoder, decoder
+        if _cover_cache is None:
+            from LSB_Cache import CoverCache
+            _cover_cache = CoverCache(_CACHE_BYTES)
+        strip_height = int(job['strip_height']) if 'strip_height' in job else None
+        key = str(job['key']) if 'key' in job else None
+        with contextlib.redirect_stdout(io.StringIO()):
+            if action == 'encode':
+                encoder(job['cover'], job['secret'], job['output'], strip_height=strip_height,
+                        bits=int(job.get('bits', 1)), key=key, cover_cache=_cover_cache,
+                        payload=job.get('payload', 'rgb'), compression=job.get('compress'))
+            else:
+                decoder(job['stegofile'], job['output'], strip_height=strip_height, key=key)
+
+        return _result(job, True, time.perf_counter() - start, os.path.getsize(job['output']))
+    except Exception as error:
+        return _result(job, False, time.perf_counter() - start, error=f"{type(error).__name__}: {error}")
+
+
+def _result(job, success, seconds, output_bytes=0, error=None):
+    return {'line': job.get('line'), 'action': job.get('action'), 'output': job.get('output'), 'success': success,
+            'seconds': round(seconds, 4), 'output_bytes': output_bytes, 'error': error}
+
+
+def _summarise(results, elapsed):
+    succeeded = [result for result in results if result['success']]
+    output_bytes = sum(result['output_bytes'] for result in succeeded)
+    return {
+        'jobs': len(results),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'elapsed_seconds': round(elapsed, 3),
+        'jobs_per_second': round(len(results) / elapsed, 3) if elapsed else 0.0,
+        'output_bytes': output_bytes,
+        'output_mb_per_second': round(output_bytes / 1048576 / elapsed, 3) if elapsed else 0.0,
+        'failures': [{'line': result['line'], 'error': result['error']} for result in results
+                     if not result['success']],
+    }
+
+
+def batch(manifest, workers=None, summary=None):
+    """Entry point for the batch subcommand. Prints one line per job and the summary, optionally writing the summary
+    to a JSON file. Returns the summary"""
+    jobs = load_manifest(manifest)
+    summary_data = run_batch(jobs, workers, report=_print_result)
+
+    print(f"Jobs: {summary_data['jobs']} | Succeeded: {summary_data['succeeded']} | Failed: {summary_data['failed']} | "
+          f"Elapsed: {summary_data['elapsed_seconds']}s | Jobs/s: {summary_data['jobs_per_second']} | "
+          f"MB/s written: {summary_data['output_mb_per_second']}")
+    if summary:
+        with open(summary, 'w') as summary_file:
+            json.dump(summary_data, summary_file, indent=2)
+    return summary_data
+
+
+def _print_result(result):
+    status = "OK" if result['success'] else f"FAILED ({result['error']})"
+    print(f"[line {result['line']}] {result['action']} -> {result['output']} | {result['seconds']}s | {status}",
+          flush=True)
@@ -0,0 +1,236 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+LSB_Bench.py
+
+Offline benchmark harness for the encoder and decoder. Generates synthetic covers and secrets, times encoder() and
+decoder() end to end and stage by stage, records peak memory and writes everything to a JSON file that can be checked
+against a stored baseline:
+
+  python LSB_Bench.py [--sizes 0.1 1 10] [--formats bmp png tiff] [--modes RGB L RGBA] [--bits 1] [--repeat 3]
+                      [--output bench.json] [--baseline baseline.json] [--threshold 0.2]
+
+Every case (size x format x mode) runs in a fresh interpreter, so the peak RSS of one case is not inflated by another
+and nothing is shared through PIL/numpy caches. Cases:
+  * The cover is a noise image of --sizes megapixels (4:3) saved as the case format and mode, the secret is the same
+    image type at a third of the cover's width and height, which fits at any bit depth
+  * Times are the best of --repeat runs. The end to end figures go through encoder()/decoder() exactly as the CLI
+    does, so they include whatever fast path (BMP mmap) applies. The stage figures are the LSB_Instrument records of
+    those same runs, i.e. open_secret, pack, open_cover, embed, save when encoding and open_stego, extract, save when
+    decoding (patch/extract on the BMP fast path)
+  * peak_rss_mb is the high water mark of the case's process, baseline_rss_mb is the same before any image is touched
+
+With --baseline, every time and peak RSS that is more than --threshold (a fraction, 0.2 = 20%) above the matching
+baseline case is reported as a regression and the script exits with 1. Times below --min-seconds in the baseline are
+not compared, they are mostly noise.
+"""
+
+_BIN = os.path.dirname(os.path.abspath(__file__))
+_EXTENSIONS = {'bmp': '.bmp', 'png': '.png', 'tiff': '.tif'}
+
+
+# Cases---------------------------------------------
+
+def build_cases(sizes, formats, modes):
+    return [{'megapixels': size, 'format': image_format, 'mode': mode}
+            for size in sizes for image_format in formats for mode in modes]
+
+
+def case_name(case):
+    return f"{case['format']}-{case['mode']}-{case['megapixels']:g}MP"
+
+
+def _dimensions(megapixels):
+    """Width and height of a 4:3 image of roughly megapixels"""
+    width = max(8, round(math.sqrt(megapixels * 1e6 * 4 / 3)))
+    return width, max(6, width * 3 // 4)
+
+
+def _synthetic_image(width, height, mode, seed):
+    """Noise image in mode. Noise is the worst case for PNG and keeps the LSBs of every channel in use"""
+    import numpy as np
+    from PIL import Image
+
+    rgb = np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return Image.fromarray(rgb, 'RGB').convert(mode)
+
+
+# Running---------------------------------------------
+
+def run_case(case, repeat=3, bits=1):
+    """Runs one case in the calling process. Meant to be called in a fresh worker process, see run_benchmark"""
+    sys.path.insert(0, _BIN)
+    from LSB_Image import encoder, decoder
+    from LSB_Instrument import Collector
+
+    baseline_rss = _peak_rss_mb()
+    extension = _EXTENSIONS[case['format']]
+    with tempfile.TemporaryDirectory(prefix='lsb_bench_') as workdir:
+        cover_path = os.path.join(workdir, 'Cover' + extension)
+        secret_path = os.path.join(workdir, 'Secret' + extension)
+        stego_path = os.path.join(workdir, 'Stego' + extension)
+        restored_path = os.path.join(workdir, 'Restored.png')
+
+        cover_size = _dimensions(case['megapixels'])
+        secret_size = (max(1, cover_size[0] // 3), max(1, cover_size[1] // 3))
+        _synthetic_image(*cover_size, case['mode'], 1).save(cover_path)
+        _synthetic_image(*secret_size, case['mode'], 2).save(secret_path)
+
+        def encode():
+            encoder(cover_path, secret_path, stego_path, bits=bits)
+
+        def decode():
+            decoder(stego_path, restored_path)
+
+        with contextlib.redirect_stdout(io.StringIO()), Collector() as records:
+            encode_seconds = _best_of(repeat, encode)
+            decode_seconds = _best_of(repeat, decode)
+        stages = _best_stages(records)
+        stego_bytes = os.path.getsize(stego_path)
+
+    return dict(case, case=case_name(case), bits=bits, cover_size=list(cover_size), secret_size=list(secret_size),
+                encode_seconds=encode_seconds, decode_seconds=decode_seconds, encode_stages=stages['encode'],
+                decode_stages=stages['decode'], stego_bytes=stego_bytes,
+                encode_mp_per_second=round(case['megapixels'] / encode_seconds, 3),
+                decode_mp_per_second=round(case['megapixels'] / decode_seconds, 3),
+                baseline_rss_mb=baseline_rss, peak_rss_mb=_peak_rss_mb())
+
+
+def _best_of(repeat, function):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 4)
+
+
+def _best_stages(records):
+    """Best time per stage over all repeats, from LSB_Instrument records. Returns {operation: {stage: seconds}}"""
+    stages = {'encode': {}, 'decode': {}}
+    for record in records:
+        times = stages[record['operation']]
+        seconds = round(record['seconds'], 4)
+        times[record['stage']] = min(times.get(record['stage'], seconds), seconds)
+    return stages
+
+
+def _peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)   # Linux reports kilobytes
+
+
+def run_benchmark(cases, repeat=3, bits=1, report=print):
+    """Runs every case in its own freshly spawned process. report is called with each case result. A case that fails
+    is recorded with its error instead of stopping the run"""
+    results = []
+    context = multiprocessing.get_context('spawn')        # Spawn, not fork: no memory or imports from this process
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                result = pool.submit(run_case, case, repeat, bits).result()
+            except Exception as error:
+                result = dict(case, case=case_name(case), bits=bits, error=f"{type(error).__name__}: {error}")
+        results.append(result)
+        report(result)
+
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+# Comparison---------------------------------------------
+
+def compare(current, baseline, threshold=0.2, min_seconds=0.01):
+    """Returns a list of regressions of current against baseline (both as written by run_benchmark). Cases are matched
+    by name and bit depth, cases missing from either side are skipped"""
+    baseline_cases = {(result['case'], result.get('bits', 1)): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        previous = baseline_cases.get((result['case'], result.get('bits', 1)))
+        if previous is None or 'error' in result or 'error' in previous:
+            continue
+
+        metrics = _metrics(result)
+        for metric, old in _metrics(previous).items():
+            new = metrics.get(metric)
+            if new is None or (metric != 'peak_rss_mb' and old < min_seconds):
+                continue
+            if new > old * (1 + threshold):
+                regressions.append(f"{result['case']} {metric}: {new} vs baseline {old} "
+                                   f"(+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def _metrics(result):
+    """Flattens a case result into {metric: value} for every compared figure"""
+    metrics = {'encode_seconds': result['encode_seconds'], 'decode_seconds': result['decode_seconds'],
+               'peak_rss_mb': result['peak_rss_mb']}
+    for prefix in ['encode', 'decode']:
+        for stage, seconds in result[f'{prefix}_stages'].items():
+            metrics[f'{prefix}.{stage}'] = seconds
+    return metrics
+
+
+def _print_result(result):
+    if 'error' in result:
+        print(f"{result['case']} | FAILED ({result['error']})", flush=True)
+        return
+    stages = " ".join(f"{prefix[0]}.{stage}={seconds}s" for prefix in ['encode', 'decode']
+                      for stage, seconds in result[f'{prefix}_stages'].items())
+    print(f"{result['case']} | Encode: {result['encode_seconds']}s ({result['encode_mp_per_second']} MP/s) | "
+          f"Decode: {result['decode_seconds']}s ({result['decode_mp_per_second']} MP/s) | "
+          f"Peak RSS: {result['peak_rss_mb']}MB | {stages}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LSB Steganography App - Benchmark")
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.1, 1, 10], help="Cover sizes in megapixels")
+    parser.add_argument('--formats', nargs='+', default=['bmp', 'png', 'tiff'], choices=sorted(_EXTENSIONS),
+                        help="Cover/secret file formats")
+    parser.add_argument('--modes', nargs='+', default=['RGB', 'L', 'RGBA'], help="Cover/secret PIL modes")
+    parser.add_argument('--bits', type=int, default=1, choices=[1, 2, 3, 4], help="Bits per cover channel")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case, the best time is kept")
+    parser.add_argument('--output', default='bench.json', help="JSON file the results are written to")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to check for regressions against")
+    parser.add_argument('--threshold', type=float, default=0.2, help="Allowed slowdown as a fraction, 0.2 = 20%%")
+    parser.add_argument('--min-seconds', type=float, default=0.01, help="Baseline times below this are not compared")
+    args = parser.parse_args()
+
+    current = run_benchmark(build_cases(args.sizes, args.formats, args.modes), args.repeat, args.bits,
+                            report=_print_result)
+    with open(args.output, 'w') as output_file:
+        json.dump(current, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    failed = [result['case'] for result in current['results'] if 'error' in result]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(current, json.load(baseline_file), args.threshold, args.min_seconds)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        print(f"{len(regressions)} regression(s) against {args.baseline} at a {args.threshold:.0%} threshold")
+    quit(1 if regressions or failed else 0)
+
+
+if __name__ == "__main__":
+    main()
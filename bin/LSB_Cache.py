@@ -0,0 +1,127 @@
+import hashlib
+import os
+import threading
+
+from collections import OrderedDict
+from PIL import Image
+
+from LSB_Image import rgb_buffer
+
+"""
+LSB_Cache.py
+
+Cover preparation cache for workloads that embed many secrets into the same cover. Opening, decoding and converting
+the cover to RGB is usually the most expensive part of an in-memory encode, CoverCache does it once per cover and
+hands out the decoded buffer from then on, so repeated encodes only pay for the copy, the embed and the save:
+
+  cache = CoverCache(max_bytes=512 * 1024 * 1024)
+  for secret in secrets:
+      encoder('Cover.png', secret, f'Out_{os.path.basename(secret)}', cover_cache=cache)
+  print(cache.stats())    # {'hits': 99, 'misses': 1, 'evictions': 0, 'entries': 1, 'bytes': 36000000, ...}
+
+Entries are keyed by absolute path + mtime + size, so a cover rewritten in place is decoded again. With
+by_content=True they are keyed by the SHA-256 of the file instead, which also shares one entry between copies of the
+same cover (at the cost of reading the file on every lookup). Least recently used entries are evicted once the
+decoded buffers take up more than max_bytes, a cover larger than max_bytes on its own is decoded but not kept.
+
+With clear_bits (1-4) every entry also keeps a second copy of the cover with its low clear_bits bits already cleared,
+which the embed of a payload at that bit depth ORs its bits onto in one pass instead of clearing the window first.
+It doubles the memory per entry, so it only pays off for large payloads. The cache is thread safe, the buffers it
+hands out are read-only and shared, StegImage copies them before embedding.
+
+The cache only applies to the in-memory encode path, the BMP fast path and streaming never decode the whole cover.
+"""
+
+_HASH_CHUNK = 1 << 20
+
+
+# Classes ----------------------------
+
+class CachedCover:
+    def __init__(self, buffer, info, clear_bits=None):
+        """Decoded (height, width, 3) RGB cover plus its PIL info, and the copy with the low clear_bits bits cleared
+        if asked for. All arrays are read-only"""
+        self.buffer = buffer
+        self.buffer.flags.writeable = False
+        self.info = info
+        self.height, self.width = buffer.shape[:2]
+        self.clear_bits = clear_bits
+        self.cleared = None
+        if clear_bits:
+            self.cleared = buffer & (0xFF ^ ((1 << clear_bits) - 1))
+            self.cleared.flags.writeable = False
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes + (self.cleared.nbytes if self.cleared is not None else 0)
+
+
+class CoverCache:
+    def __init__(self, max_bytes=512 * 1024 * 1024, by_content=False, clear_bits=None):
+        """LRU cache of decoded covers bounded by the total bytes of their buffers"""
+        if clear_bits is not None and clear_bits not in range(1, 5):
+            raise ValueError(f"Bits per channel must be between 1 and 4, got {clear_bits}")
+        self.max_bytes = max_bytes
+        self.by_content = by_content
+        self.clear_bits = clear_bits
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, coverimage):
+        """Returns the CachedCover of coverimage, decoding it on a miss"""
+        key = self._key(coverimage)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+
+        cached = _decode(coverimage, self.clear_bits)     # Outside the lock, other covers can be served meanwhile
+        with self._lock:
+            if key not in self._entries and cached.nbytes <= self.max_bytes:
+                self._entries[key] = cached
+                self.nbytes += cached.nbytes
+                while self.nbytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.nbytes -= evicted.nbytes
+                    self.evictions += 1
+        return cached
+
+    def clear(self):
+        """Drops every entry, the counters are kept"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes,
+                    'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
+
+    def _key(self, coverimage):
+        if self.by_content:
+            digest = hashlib.sha256()
+            with open(coverimage, 'rb') as cover_file:
+                for chunk in iter(lambda: cover_file.read(_HASH_CHUNK), b''):
+                    digest.update(chunk)
+            return digest.hexdigest()
+        stat = os.stat(coverimage)
+        return os.path.abspath(coverimage), stat.st_mtime_ns, stat.st_size
+
+
+def _decode(coverimage, clear_bits):
+    with Image.open(coverimage) as cover:
+        rgb = cover if cover.mode == 'RGB' else cover.convert('RGB')
+        buffer = rgb_buffer(rgb)
+        return CachedCover(buffer, dict(rgb.info), clear_bits)
@@ -0,0 +1,124 @@
+import hashlib
+import math
+
+import numpy as np
+
+from LSB_Engine import decrypt_array, encrypt_array
+
+"""
+LSB_Cipher.py
+
+Pluggable cipher stage applied to the payload bytes before embedding (and after extraction). Every cipher works on
+whole uint8 arrays and can start at any byte position of the payload, so chunked/streamed payloads encrypt the same
+as whole ones. The cipher used is recorded in the stego header by its id:
+
+  0  ROTATE  Rotates every byte right by 3 bits (the original cipher, default). Bulk numpy shifts, which measure
+             faster than indexing a 256 entry table with every byte; STRING_TABLE holds the table for the string
+             based reference path
+  1  KEYED   Rotation followed by an XOR with a keystream seeded from the key, plus scattering: the payload is
+             spread over the cover in runs of RUN_PIXELS pixels through a keyed bijection instead of filling it from
+             the top (see PixelScatter)
+
+The stego header itself is always embedded with ROTATE at the start of the cover, so a decoder can tell a keyed
+image apart before it has the key. Neither cipher is meant to stand up to cryptanalysis, the keyed one only makes
+the payload unreadable and its position unpredictable without the key.
+"""
+
+ROTATE = 0
+KEYED = 1
+RUN_PIXELS = 64                                           # Multiple of 8, so every run starts on a payload byte
+
+STRING_TABLE = {format(byte, '08b'): format(((byte >> 3) | (byte << 5)) & 0xFF, '08b') for byte in range(256)}
+STRING_TABLE_INVERSE = {value: key for key, value in STRING_TABLE.items()}
+
+
+def get_cipher(cipher_id, key=None):
+    """Returns the cipher for a header's cipher id. Raises ValueError for unknown ids, or a keyed cipher without key"""
+    if cipher_id == ROTATE:
+        return RotateCipher()
+    if cipher_id == KEYED:
+        if key is None:
+            raise ValueError("The payload is encrypted with a key, a key is needed to decode it")
+        return KeyedCipher(key)
+    raise ValueError(f"Unsupported cipher {cipher_id} in stego header")
+
+
+# Classes ----------------------------
+
+class RotateCipher:
+    cipher_id = ROTATE
+
+    def encrypt(self, data, position=0):
+        """Encrypts the uint8 array data, which starts at byte position of the payload. Returns a new array"""
+        return encrypt_array(data)
+
+    def decrypt(self, data, position=0):
+        return decrypt_array(data)
+
+    def scatter(self, header_channels, total_channels):
+        """Pixel order the payload is embedded in, None for filling the cover in raster order"""
+        return None
+
+
+class KeyedCipher(RotateCipher):
+    cipher_id = KEYED
+
+    def __init__(self, key):
+        """key is a str or bytes. The keystream and the scatter are seeded from two halves of its SHA-256"""
+        digest = hashlib.sha256(key.encode('utf-8') if isinstance(key, str) else bytes(key)).digest()
+        self._stream_seed = int.from_bytes(digest[:16], 'big')
+        self._scatter_seed = int.from_bytes(digest[16:], 'big')
+
+    def keystream(self, position, count):
+        """count keystream bytes starting at byte position. PCG64 can jump ahead, so any range costs the same"""
+        generator = np.random.PCG64(self._stream_seed)
+        generator.advance(position // 8)
+        skip = position % 8
+        words = generator.random_raw(-(-(skip + count) // 8)).astype('<u8')   # Same byte order on every platform
+        return words.view(np.uint8)[skip:skip + count]
+
+    def encrypt(self, data, position=0):
+        encrypted = encrypt_array(data)
+        encrypted ^= self.keystream(position, encrypted.size)
+        return encrypted
+
+    def decrypt(self, data, position=0):
+        data = np.asarray(data, dtype=np.uint8)
+        return decrypt_array(data ^ self.keystream(position, data.size))
+
+    def scatter(self, header_channels, total_channels):
+        """Scatters the payload over the whole pixels after the header"""
+        first_pixel = -(-header_channels // 3)
+        return PixelScatter(self._scatter_seed, first_pixel, total_channels // 3 - first_pixel)
+
+
+class PixelScatter:
+    def __init__(self, seed, first_pixel, pixels, run=RUN_PIXELS):
+        """Keyed bijection between the payload and the cover in runs of `run` pixels. The cover pixels from
+        first_pixel are cut into whole runs (a partial run at the very end is not used) and payload run r is stored
+        in cover run (a * r + b) % runs, with a coprime to runs. Both directions are plain vectorised arithmetic, so
+        any strip of the cover can work out which payload runs it holds without a stored permutation, and every run
+        is copied as one block of 3 * run channels. Scattering single pixels measures ~25x slower, as every pixel
+        becomes a random memory access"""
+        rng = np.random.default_rng(seed)
+        self.first_pixel = first_pixel
+        self.run = run
+        self.runs = max(pixels, 0) // run
+        self.a, self.b = 1, 0
+        if self.runs > 1:
+            self.a = int(rng.integers(1, self.runs))
+            while math.gcd(self.a, self.runs) != 1:
+                self.a = int(rng.integers(1, self.runs))
+            self.b = int(rng.integers(0, self.runs))
+        self.a_inverse = pow(self.a, -1, self.runs) if self.runs > 1 else 1
+
+    @property
+    def end_pixel(self):
+        return self.first_pixel + self.runs * self.run
+
+    def to_cover_runs(self, payload_runs):
+        """Cover run of every payload run (int64 arrays)"""
+        return (payload_runs * self.a + self.b) % self.runs
+
+    def to_payload_runs(self, cover_runs):
+        return ((cover_runs - self.b) * self.a_inverse) % self.runs
@@ -0,0 +1,118 @@
+import lzma
+import zlib
+
+"""
+LSB_Codec.py
+
+Optional compression stage applied to the payload bytes before the cipher and the embed (and undone after
+extraction). Screenshots, diagrams and other flat secrets compress many times over, and every byte saved is 8 / bits
+cover channels that are neither read nor written. The codec is recorded in the stego header by its id:
+
+  0  NONE  Payload embedded as is (default, and what headers written before this field existed hold)
+  1  ZLIB  zlib (deflate) stream, level 0-9
+  2  LZMA  xz stream, preset 0-9, slower but usually smaller
+
+Decompression is incremental: the decoder feeds the compressed bytes to a decompressor chunk by chunk as they are
+extracted, so the compressed payload is never held whole next to the restored one. The decompressor is capped at the
+size the payload can restore to, so a small crafted payload cannot inflate without bound.
+"""
+
+NONE = 0
+ZLIB = 1
+LZMA = 2
+CODECS = {'zlib': ZLIB, 'lzma': LZMA}
+DEFAULT_LEVEL = 6
+
+
+def get_codec(codec_id, level=DEFAULT_LEVEL):
+    """Returns the codec for a header's codec id (or a CODECS name). Raises ValueError for unknown ones"""
+    codec_id = CODECS.get(codec_id, codec_id)
+    if codec_id in (NONE, None):
+        return NullCodec()
+    if codec_id == ZLIB:
+        return ZlibCodec(level)
+    if codec_id == LZMA:
+        return LzmaCodec(level)
+    raise ValueError(f"Unsupported compression {codec_id!r}, choose one of {', '.join(CODECS)}")
+
+
+# Classes ----------------------------
+
+class NullCodec:
+    codec_id = NONE
+
+    def compress(self, data):
+        return data
+
+    def decompressor(self, max_size=None):
+        """Object with decompress(chunk) -> bytes and flush() -> bytes, fed the payload in order. Raises ValueError
+        once the output passes max_size bytes"""
+        return _NullDecompressor()
+
+
+class ZlibCodec(NullCodec):
+    codec_id = ZLIB
+
+    def __init__(self, level=DEFAULT_LEVEL):
+        _check_level(level)
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompressor(self, max_size=None):
+        return _StreamDecompressor(zlib.decompressobj(), max_size)
+
+
+class LzmaCodec(ZlibCodec):
+    codec_id = LZMA
+
+    def compress(self, data):
+        return lzma.compress(data, preset=self.level)
+
+    def decompressor(self, max_size=None):
+        return _StreamDecompressor(lzma.LZMADecompressor(), max_size)
+
+
+class _NullDecompressor:
+    def decompress(self, chunk):
+        return bytes(chunk)
+
+    def flush(self):
+        return b''
+
+
+class _StreamDecompressor:
+    def __init__(self, decompressor, max_size=None):
+        """Common interface over zlib.decompressobj and lzma.LZMADecompressor, checking the stream is complete and
+        restores to at most max_size bytes"""
+        self._decompressor = decompressor
+        self._max_size = max_size
+        self._size = 0
+
+    def decompress(self, chunk):
+        try:
+            if self._max_size is None:
+                return self._decompressor.decompress(bytes(chunk))
+            # One byte over the limit is enough to tell, the rest of the chunk is left compressed
+            data = self._decompressor.decompress(bytes(chunk), self._max_size - self._size + 1)
+        except (zlib.error, lzma.LZMAError) as error:
+            raise ValueError(f"Compressed payload is corrupt ({error})")
+        return self._count(data)
+
+    def flush(self):
+        if not self._decompressor.eof:
+            raise ValueError("Compressed payload ended early, the stego image is damaged")
+        return self._count(self._decompressor.flush() if hasattr(self._decompressor, 'flush') else b'')
+
+    def _count(self, data):
+        self._size += len(data)
+        if self._max_size is not None and self._size > self._max_size:
+            raise ValueError(f"Compressed payload restores to more than the {self._max_size} bytes its header "
+                             f"allows, the stego image is damaged")
+        return data
+
+
+def _check_level(level):
+    if level not in range(0, 10):
+        raise ValueError(f"Compression level must be between 0 and 9, got {level}")
@@ -0,0 +1,252 @@
+import contextlib
+import os
+import shutil
+import struct
+import zlib
+
+import numpy as np
+
+from PIL import Image
+
+from LSB_BMP import BMPImage, is_fast_bmp
+from LSB_Cipher import ROTATE, KeyedCipher, RotateCipher, get_cipher
+from LSB_Engine import ChannelArray, channels_needed, decrypt_array, encrypt_array
+from LSB_Header import CONTAINER_MODE, FILE_MODE, FIXED_SIZE, StegoHeader, has_magic
+from LSB_Image import StegImage
+from LSB_Writer import check_lossless
+
+"""
+LSB_Container.py
+
+Multi-payload containers: any number of files (images or not) hidden in one cover, each extractable on its own. The
+cover starts with an ordinary StegoHeader of mode CONTAINER_MODE whose payload is a fixed size directory, written
+like every header at 1 bit per channel with the rotation cipher:
+
+  magic      4s   b'LSBD'
+  slots      H    Number of directory entries the container was created with
+  count      H    Number of entries in use
+  entries         slots x 100 bytes, unused ones zeroed:
+    name     64s  utf-8 name, null padded
+    mode     4s   b'FILE' (raw file bytes)
+    width    I    Reserved for image payloads, 0
+    height   I    Reserved for image payloads, 0
+    offset   Q    First cover channel of the payload
+    length   Q    Payload length in bytes
+    bits     B    Payload bits per cover channel, 1-4
+    cipher   B    Payload cipher id, see LSB_Cipher
+    reserved 2x
+    crc32    I    CRC-32 of the plain payload bytes
+
+The directory sits at a fixed place and every entry records where its payload starts, so extracting one payload reads
+the header, the directory and that payload's channels only (on the BMP fast path only those rows are touched).
+Payloads are packed one after the other behind the directory. Appending writes the new payload into the free
+channels first and then its entry and the new count, the payloads already there are never re-embedded. An
+uncompressed BMP container is appended to in place, other formats are decoded and saved again as a whole.
+
+Keyed payloads use the keystream of their key at their channel offset, but are not scattered, so the free space
+stays one block at the end of the cover.
+"""
+
+DEFAULT_SLOTS = 16
+
+_MAGIC = b'LSBD'
+_DIRECTORY = struct.Struct('>4sHH')
+_ENTRY = struct.Struct('>64s4sIIQQBB2xI')
+_DIRECTORY_OFFSET = FIXED_SIZE * 8                        # The container header has no name
+
+
+def create_container(coverimage, outfile, slots=DEFAULT_SLOTS, workers=1):
+    """Writes an empty container with room for `slots` payloads into a copy of coverimage. Returns the number of
+    cover channels left for payloads"""
+    if slots not in range(1, 0x10000):
+        raise ValueError(f"A container holds between 1 and 65535 payloads, got {slots}")
+    header = StegoHeader("", CONTAINER_MODE, 0, 0, _DIRECTORY.size + slots * _ENTRY.size)
+
+    with _WritableStego(coverimage, outfile, workers) as stego:
+        if _DIRECTORY_OFFSET + header.length * 8 > stego.size:
+            raise ValueError(f"{coverimage} is too small to hold a directory of {slots} payloads")
+        directory = _DIRECTORY.pack(_MAGIC, slots, 0) + bytes(slots * _ENTRY.size)
+        stego.embed(encrypt_array(np.frombuffer(header.pack(), dtype=np.uint8)))
+        stego.embed(encrypt_array(np.frombuffer(directory, dtype=np.uint8)), _DIRECTORY_OFFSET)
+        return stego.size - _DIRECTORY_OFFSET - header.length * 8
+
+
+def add_payload(stegofile, source, name=None, outfile=None, bits=1, key=None, workers=1):
+    """Appends the bytes of the file source to the container stegofile under name (defaults to the file's base
+    name). The result is written to outfile, or back into stegofile. Returns the new ContainerEntry and the number of
+    cover channels still free behind it"""
+    with open(source, 'rb') as source_file:
+        data = source_file.read()
+
+    with _WritableStego(stegofile, outfile or stegofile, workers) as stego:
+        container = Container(stego)
+        entry = container.append(name or os.path.basename(source), data, bits, key)
+    return entry, container.free_channels
+
+
+def list_payloads(stegofile):
+    """Returns the ContainerEntry of every payload in the container stegofile"""
+    with _open_stego(stegofile) as stego:
+        return Container(stego).entries
+
+
+def extract_payload(stegofile, name, outfile=None, key=None, workers=1):
+    """Extracts the payload called name (or at index name) from the container stegofile. Returns its bytes and also
+    writes them to outfile if given"""
+    with _open_stego(stegofile, workers) as stego:
+        data = Container(stego).read(name, key)
+    if outfile:
+        with open(outfile, 'wb') as output_file:
+            output_file.write(data)
+    return data
+
+
+def is_container(header):
+    return header is not None and header.mode == CONTAINER_MODE
+
+
+# Classes ----------------------------
+
+class ContainerEntry:
+    def __init__(self, name, offset, length, bits=1, cipher=ROTATE, checksum=0, mode=FILE_MODE, width=0, height=0):
+        self.name = name
+        self.offset = offset
+        self.length = length
+        self.bits = bits
+        self.cipher = cipher
+        self.checksum = checksum
+        self.mode = mode
+        self.width = width
+        self.height = height
+
+    @property
+    def end(self):
+        """Channel just past the payload"""
+        return self.offset + channels_needed(self.length, self.bits)
+
+    def pack(self):
+        name = self.name.encode('utf-8')
+        if not name or len(name) > 64:
+            raise ValueError(f"Payload names must be 1 to 64 utf-8 bytes, {self.name!r} is {len(name)}")
+        return _ENTRY.pack(name, self.mode.encode('ascii'), self.width, self.height, self.offset, self.length,
+                           self.bits, self.cipher, self.checksum)
+
+    @classmethod
+    def unpack(cls, data):
+        name, mode, width, height, offset, length, bits, cipher, checksum = _ENTRY.unpack(bytes(data))
+        return cls(name.rstrip(b'\x00').decode('utf-8'), offset, length, bits, cipher, checksum,
+                   mode.rstrip(b'\x00').decode('ascii'), width, height)
+
+    def __repr__(self):
+        return f"ContainerEntry({self.name!r}, offset={self.offset}, length={self.length}, bits={self.bits})"
+
+
+class Container:
+    def __init__(self, stego):
+        """Reads the container directory of stego, anything with size/extract/embed (i.e. ChannelArray or
+        BMPImage). Raises ValueError if stego does not hold a container"""
+        self.stego = stego
+        fixed = decrypt_array(stego.extract(FIXED_SIZE)).tobytes() if stego.size >= _DIRECTORY_OFFSET else b''
+        if not has_magic(fixed) or not is_container(StegoHeader.unpack_fixed(fixed)[0]):
+            raise ValueError("No multi-payload container found, create one first")
+
+        magic, self.slots, count = _DIRECTORY.unpack(self._read_directory(0, _DIRECTORY.size))
+        if magic != _MAGIC or count > self.slots:
+            raise ValueError("The container directory is damaged")
+        entries = self._read_directory(_DIRECTORY.size, count * _ENTRY.size)
+        self.entries = [ContainerEntry.unpack(entries[idex:idex + _ENTRY.size])
+                        for idex in range(0, len(entries), _ENTRY.size)]
+
+    @property
+    def data_start(self):
+        return _DIRECTORY_OFFSET + (_DIRECTORY.size + self.slots * _ENTRY.size) * 8
+
+    @property
+    def next_offset(self):
+        return max([self.data_start] + [entry.end for entry in self.entries])
+
+    @property
+    def free_channels(self):
+        return self.stego.size - self.next_offset
+
+    def find(self, name):
+        """Returns the entry called name, or the one at index name for an int"""
+        if isinstance(name, int):
+            if not -len(self.entries) <= name < len(self.entries):
+                raise ValueError(f"The container has no payload {name}, it holds {len(self.entries)}")
+            return self.entries[name]
+        for entry in self.entries:
+            if entry.name == name:
+                return entry
+        raise ValueError(f"The container has no payload named {name!r}")
+
+    def read(self, name, key=None):
+        """Extracts and checks one payload, reading only its own channels"""
+        entry = self.find(name)
+        cipher = get_cipher(entry.cipher, key)
+        data = cipher.decrypt(self.stego.extract(entry.length, entry.offset, entry.bits), entry.offset).tobytes()
+        if zlib.crc32(data) != entry.checksum:
+            raise ValueError(f"Payload {entry.name!r} failed its checksum, the container is damaged or the key is "
+                             f"wrong")
+        return data
+
+    def append(self, name, data, bits=1, key=None):
+        """Embeds data behind the last payload and records it in the next free directory slot"""
+        if any(entry.name == name for entry in self.entries):
+            raise ValueError(f"The container already holds a payload named {name!r}")
+        if len(self.entries) == self.slots:
+            raise ValueError(f"All {self.slots} directory slots of the container are in use")
+
+        cipher = KeyedCipher(key) if key is not None else RotateCipher()
+        entry = ContainerEntry(name, self.next_offset, len(data), bits, cipher.cipher_id, zlib.crc32(data))
+        packed = entry.pack()
+        if entry.end > self.stego.size:
+            raise ValueError(f"{name} needs {channels_needed(len(data), bits)} channels at {bits} bits per channel, "
+                             f"the container has {self.free_channels} left")
+
+        self.stego.embed(cipher.encrypt(np.frombuffer(data, dtype=np.uint8), entry.offset), entry.offset, bits)
+        self._write_directory(_DIRECTORY.size + len(self.entries) * _ENTRY.size, packed)
+        self._write_directory(0, _DIRECTORY.pack(_MAGIC, self.slots, len(self.entries) + 1))   # Count goes last
+        self.entries.append(entry)
+        return entry
+
+    def _read_directory(self, start, nbytes):
+        return decrypt_array(self.stego.extract(nbytes, _DIRECTORY_OFFSET + start * 8)).tobytes()
+
+    def _write_directory(self, start, data):
+        self.stego.embed(encrypt_array(np.frombuffer(data, dtype=np.uint8)), _DIRECTORY_OFFSET + start * 8)
+
+
+class _WritableStego:
+    def __init__(self, source, outfile, workers=1):
+        """source opened for embedding, with the result going to outfile once closed without an error. BMP to BMP
+        copies the file (unless it is the same one) and patches it in place, anything else is decoded and saved"""
+        check_lossless(outfile)
+        self.outfile = outfile
+        self._steg_image = None
+        if is_fast_bmp(source) and os.path.splitext(outfile)[1].lower() == '.bmp':
+            if not os.path.exists(outfile) or not os.path.samefile(source, outfile):
+                shutil.copyfile(source, outfile)
+            self._stego = BMPImage(outfile, writable=True, workers=workers)
+        else:
+            with Image.open(source) as image:
+                self._steg_image = StegImage(image if image.mode == 'RGB' else image.convert('RGB'), outfile, workers)
+            self._stego = ChannelArray(self._steg_image.channels, workers)
+
+    def __enter__(self):
+        return self._stego
+
+    def __exit__(self, exc_type, *exc):
+        if self._steg_image is None:
+            self._stego.close()
+        elif exc_type is None:
+            self._steg_image.write_image()
+
+
+def _open_stego(stegofile, workers=1):
+    """Read only stego image, memory-mapped for uncompressed BMPs. Use as a context manager"""
+    if is_fast_bmp(stegofile):
+        return BMPImage(stegofile, workers=workers)
+    with Image.open(stegofile) as image:
+        channels = np.asarray(image if image.mode == 'RGB' else image.convert('RGB'), dtype=np.uint8).reshape(-1)
+    return contextlib.nullcontext(ChannelArray(channels, workers))
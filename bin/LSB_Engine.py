@@ -0,0 +1,350 @@
+import numpy as np
+
+"""
+LSB_Engine.py
+
+Vectorised embedding engine. Works on the cover as one flat uint8 array of channel values (R, G, B, R, G, B, ...)
+in raster order, which is exactly the order the pixel generators in LSB_Image walk the cover in. Every payload byte
+is spread MSB first over the LSB of 8 consecutive channels, so the output is bit-for-bit identical to the
+string based path in LSB_Image.reference_encoder. With bits > 1 (up to 4) the payload bit stream is cut into groups
+of that many bits, each group replacing the low bits of one channel. A segment can also be scattered, in which case
+its channels are laid out run by run in the order of a LSB_Cipher.PixelScatter instead of the raster order.
+
+A segment is (payload, channel offset, bits per channel, scatter or None), the file backends take lists of them.
+
+Work is done in bands of _BAND channels, which keeps the temporaries in cache. Every payload byte and every band
+boundary lands on a fixed channel, so bands are independent: with workers > 1 they are run on a thread pool (numpy
+releases the GIL inside the array kernels). The bands write disjoint memory, so the output is identical to the serial
+path whatever the worker count.
+"""
+
+_SCATTER_BLOCK = 1 << 16                                  # Runs per block, bounds the size of the index arrays
+_BAND = 3 << 16                                           # Channels per band, a multiple of 8 and 3
+
+
+# Payload Packing---------------------------------------------
+
+def pack_payload(secret_array, metadata):
+    """Flattens the RGB secret array and appends the metadata bytes, returning the encrypted byte stream"""
+    payload = np.concatenate((np.ascontiguousarray(secret_array, dtype=np.uint8).reshape(-1),
+                              np.frombuffer(metadata, dtype=np.uint8)))
+    return encrypt_array(payload)
+
+
+# Embedding / Extraction---------------------------------------------
+
+def channels_needed(nbytes, bits=1):
+    """Number of channels nbytes take up at bits per channel"""
+    return -(-nbytes * 8 // bits)
+
+
+def embed(channels, payload, offset=0, bits=1, cleared=None, workers=1):
+    """Writes every bit of payload into the low `bits` bits of channels (flat uint8 array), starting at channel
+    offset. Channels is modified in place. Returns the channel offset after the payload. cleared is an optional copy
+    of channels with the low `bits` bits already cleared (see LSB_Cache), every band is then written in one pass"""
+    _check_bits(bits)
+    end = offset + channels_needed(payload.size, bits)
+    if end > channels.size:
+        raise ValueError(f"Payload needs {end - offset} channels from offset {offset}, cover only has "
+                         f"{channels.size}")
+    embed_window(channels, payload, 0, offset, bits, cleared, workers)
+    return end
+
+
+def embed_window(window, payload, window_start, offset=0, bits=1, cleared=None, workers=1):
+    """Embeds the part of payload that falls inside window, where window holds the channels starting at
+    window_start and the payload starts at channel offset. Used when the cover is only available in pieces"""
+    _check_bits(bits)
+    low = max(window_start, offset)
+    high = min(window_start + window.size, offset + channels_needed(payload.size, bits))
+    if low >= high:
+        return
+    keep = 0xFF ^ ((1 << bits) - 1)
+
+    def embed_band(band):
+        first, last = band                                # Payload channels, relative to offset
+        start, stop = offset + first - window_start, offset + last - window_start
+        values = _channel_values(payload, first, last, bits)
+        if cleared is not None:
+            np.bitwise_or(cleared[start:stop], values, out=window[start:stop])
+            return
+        section = window[start:stop]
+        section &= keep                                   # Clear the low bits in bulk, then OR the secret bits in
+        section |= values
+
+    run_parallel(embed_band, _bands(low - offset, high - offset), workers)
+
+
+def extract(channels, nbytes, offset=0, bits=1, workers=1):
+    """Reads nbytes worth of low `bits` bits from channels starting at channel offset and packs them back into
+    bytes"""
+    _check_bits(bits)
+    end = offset + channels_needed(nbytes, bits)
+    if end > channels.size:
+        raise ValueError(f"Cannot read {nbytes} bytes from offset {offset}, stego only has {channels.size} channels")
+    return pack_values(channels[offset:end], nbytes, bits, workers)
+
+
+def pack_values(values, nbytes, bits=1, workers=1):
+    """Packs channel values (only the low `bits` bits of each are used, in payload order) back into nbytes bytes"""
+    count = channels_needed(nbytes, bits)
+    packed = np.empty(-(-count // 8) * bits, dtype=np.uint8)
+
+    def pack_band(band):
+        first, last = band
+        packed[first * bits // 8:-(-last // 8) * bits] = _pack_groups(values[first:last] & ((1 << bits) - 1), bits)
+
+    run_parallel(pack_band, _bands(0, count), workers)
+    return packed[:nbytes]
+
+
+def check_segments(segments, capacity):
+    """Raises ValueError if any segment does not fit into capacity channels. Returns the channel offset after the
+    last channel the segments can touch (the end of the scatter for scattered segments)"""
+    end = 0
+    for payload, offset, bits, scatter in segments:
+        needed = channels_needed(payload.size, bits)
+        if scatter:
+            _check_scatter(needed, scatter)
+            segment_end = scatter.end_pixel * 3
+        else:
+            segment_end = offset + needed
+        if segment_end > capacity:
+            raise ValueError(f"Payload needs {segment_end} channels, cover only has {capacity}")
+        end = max(end, segment_end)
+    return end
+
+
+# Scattered Embedding / Extraction---------------------------------------------
+
+def embed_scattered(window, payload, window_start, scatter, bits=1, workers=1):
+    """Scattered form of embed_window: payload run r (3 * scatter.run channels) goes into cover run
+    scatter.to_cover_runs(r). window holds the channels from window_start (the whole flat cover with window_start 0
+    embeds everything in one go), only the payload channels falling inside it are written. With workers > 1 the
+    window is cut into that many pieces, embedded on a thread pool"""
+    _check_bits(bits)
+    if workers > 1:
+        run_parallel(lambda piece: embed_scattered(window[piece[0]:piece[1]], payload, window_start + piece[0],
+                                                   scatter, bits), _pieces(window.size, window_start, workers),
+                     workers)
+        return
+    needed = channels_needed(payload.size, bits)
+    runs = _check_scatter(needed, scatter)
+    run_channels = scatter.run * 3
+    tail = needed - (runs - 1) * run_channels            # Channels of the last run that hold payload
+    keep = 0xFF ^ ((1 << bits) - 1)
+
+    for view, rows, payload_runs, columns in _run_blocks(window, window_start, scatter, runs):
+        values = _run_values(payload, payload_runs, run_channels, bits)[:, columns]
+        original = view[rows]
+        stego = (original & keep) | values
+        if tail < run_channels:                           # Channels past the payload keep their cover value
+            last = np.flatnonzero(payload_runs == runs - 1)
+            past = max(tail - (columns.start or 0), 0)
+            stego[last, past:] = original[last, past:]
+        view[rows] = stego
+
+
+def extract_scattered(window, values, window_start, scatter, bits=1, workers=1):
+    """Counterpart of embed_scattered. Fills values (one uint8 per payload channel, as made by scattered_values)
+    with the low bits of the payload channels that fall inside window"""
+    _check_bits(bits)
+    if workers > 1:
+        run_parallel(lambda piece: extract_scattered(window[piece[0]:piece[1]], values, window_start + piece[0],
+                                                     scatter, bits), _pieces(window.size, window_start, workers),
+                     workers)
+        return
+    runs = _check_scatter(values.size, scatter)
+    values = values.reshape(runs, scatter.run * 3)
+
+    for view, rows, payload_runs, columns in _run_blocks(window, window_start, scatter, runs):
+        values[payload_runs, columns] = view[rows] & ((1 << bits) - 1)
+
+
+def scattered_values(nbytes, bits, scatter):
+    """Zeroed buffer for extract_scattered to fill, whole runs long. pack_values ignores the padding"""
+    run_channels = scatter.run * 3
+    return np.zeros(-(-channels_needed(nbytes, bits) // run_channels) * run_channels, dtype=np.uint8)
+
+
+def _run_blocks(window, window_start, scatter, runs):
+    """Yields (view, rows, payload runs, columns) for the first `runs` payload runs held by the window: view[rows]
+    are the cover channels of those payload runs, columns the slice of the run's channels they cover. Whole runs come
+    in blocks, the run cut off at either end of the window as a single row"""
+    run_channels = scatter.run * 3
+    origin = scatter.first_pixel * 3
+    low = max(window_start, origin)
+    high = min(window_start + window.size, scatter.end_pixel * 3)
+    if low >= high:
+        return
+
+    first, last = (low - origin) // run_channels, -(-(high - origin) // run_channels)
+    whole_first = -(-(low - origin) // run_channels)
+    whole_last = max((high - origin) // run_channels, whole_first)
+    for cover_run in sorted({first, last - 1} - set(range(whole_first, whole_last))):
+        payload_run = scatter.to_payload_runs(np.array([cover_run], dtype=np.int64))
+        if payload_run[0] < runs:                         # Run cut off by the window edge
+            run_start = origin + cover_run * run_channels
+            start, end = max(low, run_start), min(high, run_start + run_channels)
+            view = window[start - window_start:end - window_start].reshape(1, -1)
+            yield view, np.zeros(1, dtype=np.int64), payload_run, slice(start - run_start, end - run_start)
+
+    if whole_first >= whole_last:
+        return
+    start = origin + whole_first * run_channels - window_start
+    view = window[start:start + (whole_last - whole_first) * run_channels].reshape(-1, run_channels)
+    if runs <= whole_last - whole_first:                  # Fewer payload runs than cover runs: map them forwards
+        for first in range(0, runs, _SCATTER_BLOCK):
+            payload_runs = np.arange(first, min(first + _SCATTER_BLOCK, runs), dtype=np.int64)
+            cover_runs = scatter.to_cover_runs(payload_runs)
+            inside = (cover_runs >= whole_first) & (cover_runs < whole_last)
+            yield view, cover_runs[inside] - whole_first, payload_runs[inside], slice(None)
+    else:
+        for first in range(whole_first, whole_last, _SCATTER_BLOCK):
+            cover_runs = np.arange(first, min(first + _SCATTER_BLOCK, whole_last), dtype=np.int64)
+            payload_runs = scatter.to_payload_runs(cover_runs)
+            used = payload_runs < runs
+            yield view, cover_runs[used] - whole_first, payload_runs[used], slice(None)
+
+
+def _run_values(payload, payload_runs, run_channels, bits):
+    """(len(payload_runs), run_channels) channel values of the payload runs. A run is a whole number of payload bytes,
+    so the runs' bytes are gathered first and unpacked in one go"""
+    run_bytes = run_channels * bits // 8
+    whole = payload.size // run_bytes
+    gathered = np.zeros((payload_runs.size, run_bytes), dtype=np.uint8)
+    complete = payload_runs < whole
+    gathered[complete] = payload[:whole * run_bytes].reshape(whole, run_bytes)[payload_runs[complete]]
+    gathered[~complete, :payload.size - whole * run_bytes] = payload[whole * run_bytes:]   # The short last run
+    return _channel_values(gathered.reshape(-1), 0, gathered.size * 8 // bits, bits).reshape(-1, run_channels)
+
+
+def _check_scatter(needed, scatter):
+    """Returns the number of runs needed channels take up, raising ValueError if scatter is too small"""
+    runs = -(-needed // (scatter.run * 3))
+    if runs > scatter.runs:
+        raise ValueError(f"Payload needs {runs * scatter.run} scattered pixels, cover only has "
+                         f"{scatter.runs * scatter.run} after the header")
+    return runs
+
+
+def _channel_values(payload, first, last, bits):
+    """Values for relative payload channels [first, last): the payload bit stream cut into `bits` sized groups.
+    Only the payload bytes this range needs are unpacked, missing bits at the very end are zero"""
+    if bits == 1:
+        payload_bits = np.unpackbits(payload[first // 8:-(-last // 8)])
+        return payload_bits[first % 8:first % 8 + last - first]
+
+    first_group, last_group = first // 8, -(-last // 8)  # 8 channels hold exactly `bits` payload bytes
+    data = payload[first_group * bits:last_group * bits]
+    if data.size < (last_group - first_group) * bits:
+        data = np.concatenate((data, np.zeros((last_group - first_group) * bits - data.size, dtype=np.uint8)))
+
+    groups = data.reshape(-1, bits)
+    word = groups[:, 0].astype(np.uint32)               # The group's bits as one integer, first byte highest
+    for column in range(1, bits):
+        word <<= 8
+        word |= groups[:, column]
+    values = np.empty((groups.shape[0], 8), dtype=np.uint8)
+    for channel in range(8):
+        np.bitwise_and(word >> ((7 - channel) * bits), (1 << bits) - 1, out=values[:, channel], casting='unsafe')
+    return values.reshape(-1)[first - first_group * 8:last - first_group * 8]
+
+
+def _pack_groups(values, bits):
+    """Inverse of _channel_values for channel values starting at a group (a multiple of 8 channels). A short last
+    group is padded with zeros"""
+    if bits == 1:
+        return np.packbits(values)
+    if values.size % 8:
+        values = np.concatenate((values, np.zeros(-values.size % 8, dtype=np.uint8)))
+
+    channels = values.reshape(-1, 8)
+    word = channels[:, 0].astype(np.uint32)
+    for channel in range(1, 8):
+        word <<= bits
+        word |= channels[:, channel]
+    packed = np.empty((channels.shape[0], bits), dtype=np.uint8)
+    for column in range(bits):
+        np.right_shift(word, 8 * (bits - 1 - column), out=packed[:, column], casting='unsafe')
+    return packed.reshape(-1)
+
+
+# Bands---------------------------------------------
+
+def run_parallel(function, items, workers=1):
+    """Calls function(item) for every item, on a pool of up to `workers` threads when there is more than one item.
+    The items must write disjoint memory, the order they run in then does not matter"""
+    if workers <= 1 or len(items) < 2:
+        for item in items:
+            function(item)
+        return
+
+    from concurrent.futures import ThreadPoolExecutor    # Only loaded for parallel runs
+    with ThreadPoolExecutor(min(workers, len(items))) as pool:
+        for _ in pool.map(function, items):               # Re-raises the first error of any band
+            pass
+
+
+def _bands(first, last):
+    """Splits relative payload channels [first, last) at the multiples of _BAND, so all but the first band start on
+    a group of 8 channels"""
+    edges = [first] + list(range((first // _BAND + 1) * _BAND, last, _BAND)) + [last]
+    return list(zip(edges, edges[1:]))
+
+
+def _pieces(size, window_start, count):
+    """Cuts a window of size channels into up to count (start, stop) pieces that end on pixel boundaries"""
+    edges = {0, size}
+    for piece in range(1, count):
+        edge = piece * size // count
+        edges.add(edge - (window_start + edge) % 3)
+    edges = sorted(edge for edge in edges if 0 <= edge <= size)
+    return list(zip(edges, edges[1:]))
+
+
+def _check_bits(bits):
+    if bits not in range(1, 5):
+        raise ValueError(f"Bits per channel must be between 1 and 4, got {bits}")
+
+
+# Classes ----------------------------
+
+class ChannelArray:
+    def __init__(self, channels, workers=1):
+        """Flat uint8 channel array with the same embed/extract interface as the file backed stego images
+        (i.e. LSB_BMP.BMPImage), so header and trailer readers work on either. workers is the thread count the
+        embed/extract bands are spread over"""
+        self.channels = channels
+        self.workers = workers
+
+    @property
+    def size(self):
+        return self.channels.size
+
+    def embed(self, payload, offset=0, bits=1, scatter=None):
+        if scatter:
+            embed_scattered(self.channels, payload, 0, scatter, bits, self.workers)
+            return self.channels.size
+        return embed(self.channels, payload, offset, bits, workers=self.workers)
+
+    def extract(self, nbytes, offset=0, bits=1, scatter=None):
+        if scatter:
+            values = scattered_values(nbytes, bits, scatter)
+            extract_scattered(self.channels, values, 0, scatter, bits, self.workers)
+            return pack_values(values, nbytes, bits, self.workers)
+        return extract(self.channels, nbytes, offset, bits, self.workers)
+
+
+# Cryptography---------------------------------------------
+
+def encrypt_array(data):
+    """Array form of LSB_Image.encryption. Rotates every byte right by 3 bits"""
+    data = np.asarray(data, dtype=np.uint8)
+    return (data >> 3) | (data << 5)
+
+
+def decrypt_array(data):
+    """Array form of LSB_Image.decryption. Rotates every byte left by 3 bits"""
+    data = np.asarray(data, dtype=np.uint8)
+    return (data << 3) | (data >> 5)
@@ -0,0 +1,134 @@
+import os
+import re
+import struct
+
+"""
+LSB_Header.py
+
+Binary stego header written at the very start of the LSB stream (before the payload):
+
+  magic      4s   b'LSBS'
+  version    B    Header version, currently 1
+  mode       4s   PIL mode of the payload image, null padded i.e. b'RGB\x00', or b'FILE' for the secret's file bytes
+  width      I    Payload image width
+  height     I    Payload image height
+  length     Q    Payload length in bytes
+  name_len   H    Length of the utf-8 name that directly follows the fixed part
+  bits       B    Payload bits per cover channel, 1-4 (0 in headers written before this field existed, read as 1)
+  cipher     B    Payload cipher id, see LSB_Cipher (0, the original 3 bit rotation, in older headers)
+  codec      B    Payload compression id, see LSB_Codec (0, uncompressed, in older headers)
+  reserved   x    Zero, reserved for encoding options
+
+All integers are big-endian. The header itself is always embedded with the rotation cipher and 1 bit per channel, so
+the decoder can read it before it knows the bit depth or key, and always knows where the payload starts and exactly
+how many bytes to read. The payload follows at `bits` bits per channel, compressed with `codec` and then encrypted
+with `cipher`. length is the number of bytes embedded, after compression.
+
+A header with mode CONTAINER_MODE carries a multi-payload directory instead of an image, see LSB_Container.
+"""
+
+MAGIC = b'LSBS'
+VERSION = 1
+
+_FIXED = struct.Struct('>4sB4sIIQHBBBx')
+FIXED_SIZE = _FIXED.size
+CONTAINER_MODE = 'DIR'
+FILE_MODE = 'FILE'
+
+
+class StegoHeader:
+    def __init__(self, name, mode, width, height, length, bits=1, cipher=0, codec=0):
+        self.name = name
+        self.mode = mode
+        self.width = width
+        self.height = height
+        self.length = length
+        self.bits = bits
+        self.cipher = cipher
+        self.codec = codec
+
+    def pack(self):
+        name = self.name.encode('utf-8')
+        if len(name) > 0xFFFF:
+            raise ValueError(f"Payload name is too long to store in the header ({len(name)} bytes)")
+        fixed = _FIXED.pack(MAGIC, VERSION, self.mode.encode('ascii'), self.width, self.height, self.length,
+                            len(name), self.bits, self.cipher, self.codec)
+        return fixed + name
+
+    @property
+    def size(self):
+        return FIXED_SIZE + len(self.name.encode('utf-8'))
+
+    @classmethod
+    def unpack_fixed(cls, data):
+        """Parses the fixed part of the header. Returns (header with an empty name, name length) or raises
+        ValueError if data does not start with a supported header"""
+        if len(data) < FIXED_SIZE:
+            raise ValueError(f"Header needs {FIXED_SIZE} bytes, got {len(data)}")
+
+        magic, version, mode, width, height, length, name_len, bits, cipher, codec = _FIXED.unpack(
+            bytes(data[:FIXED_SIZE]))
+        if magic != MAGIC:
+            raise ValueError("No stego header found")
+        if version != VERSION:
+            raise ValueError(f"Unsupported stego header version {version}")
+        if bits > 4:
+            raise ValueError(f"Unsupported bits per channel {bits} in stego header")
+
+        return cls("", mode.rstrip(b'\x00').decode('ascii'), width, height, length, bits or 1, cipher, codec), name_len
+
+
+def has_magic(data):
+    return bytes(data[:len(MAGIC)]) == MAGIC
+
+
+class TrailerScanner:
+    def __init__(self):
+        """Incremental search over decrypted hidden bytes for the legacy ###name.ext###WxH###END trailer. Only the
+        newly fed bytes are searched, so scanning a whole payload is linear in its size"""
+        self.data = bytearray()
+        self.meta_start = -1
+        self.meta_end = -1
+        self._search_from = 0
+
+    def feed(self, chunk):
+        """Adds chunk to the scanned data. Returns True once the trailer is complete"""
+        self.data += chunk
+        if self.meta_start < 0:                           # Trailer starts with the first "###" that lines up with
+            self.meta_start = _find_aligned(self.data, b"###", self._search_from)   # a hidden pixel boundary
+            self._search_from = max(0, len(self.data) - 2)
+            if self.meta_start >= 0:
+                self._search_from = self.meta_start + 3
+
+        if self.meta_start >= 0:
+            end = self.data.find(b"###END", self._search_from)
+            if end >= 0:
+                self.meta_end = end + 6
+                return True
+            self._search_from = max(self._search_from, len(self.data) - 5)
+        return False
+
+    def split(self):
+        """Returns (image bytes, trailer bytes) once feed has returned True"""
+        return bytes(self.data[:self.meta_start]), bytes(self.data[self.meta_start:self.meta_end])
+
+
+def parse_trailer(trailer):
+    """(name, .ext, width, height) from the bytes of a complete legacy ###name.ext###WxH###END trailer"""
+    fields = trailer.decode('utf-8', errors='replace').split("###")
+    file_name, file_extension = split_trailer_name(fields[1])
+    width, height = fields[2].split("x")
+    return file_name, file_extension, int(width), int(height)
+
+
+def split_trailer_name(filename_ext_data):
+    """(name, .ext) of the secret's path as stored in a legacy trailer, written with / or \\ separators"""
+    return os.path.splitext(re.split(r'[\\/]', filename_ext_data)[-1])
+
+
+def _find_aligned(data, pattern, start):
+    """data.find(pattern) restricted to matches that begin on a 3 byte (pixel) boundary"""
+    idex = data.find(pattern, start)
+    while idex >= 0 and idex % 3:
+        idex = data.find(pattern, idex + 1)
+    return idex
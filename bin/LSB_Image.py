@@ -1,69 +1,479 @@
+import contextlib
+import io
 import logging
 import os.path
-import re
+import zlib
+
+import numpy as np
 
-from collections import deque
 from itertools import islice, product, zip_longest
-from logging.handlers import RotatingFileHandler
 from PIL import Image
 
+from LSB_BMP import BMPImage, copy_and_patch, is_fast_bmp
+from LSB_Codec import DEFAULT_LEVEL, get_codec
+from LSB_Cipher import STRING_TABLE, STRING_TABLE_INVERSE, KeyedCipher, RotateCipher, get_cipher
+from LSB_Engine import ChannelArray, channels_needed, decrypt_array, embed, embed_scattered, encrypt_array, \
+    pack_payload
+from LSB_Header import CONTAINER_MODE, FILE_MODE, FIXED_SIZE, StegoHeader, TrailerScanner, has_magic, parse_trailer, \
+    split_trailer_name
+from LSB_Instrument import Stage, get_logger
+from LSB_Preflight import PALETTE_BYTES, PAYLOADS, image_info, native_mode, restored_size
+from LSB_Stream import stream_embed, stream_extract
+from LSB_Writer import check_lossless, open_writer, verify_output
+
 
 # Classes ----------------------------
 
 class StegImage:
-    def __init__(self, height, width, cover, outfile):
-        self.height = height
-        self.width = width
-        self.cover = cover
+    def __init__(self, cover, outfile, workers=1):
+        """Wraps one writable (height, width, 3) pixel buffer taken from the already converted RGB cover. The embed
+        step writes into it in place (in bands on `workers` threads) and write_image saves straight from it. Peak
+        memory is about 7 bytes per pixel: the buffer (3) next to PIL's decoded cover (4, PIL holds RGB as 4 bytes
+        per pixel) while it is copied, and next to PIL's copy of it while saving through PIL. Saving with
+        OutputOptions writes .png/.bmp from the buffer a few rows at a time and adds next to nothing"""
+        self.width, self.height = cover.size
+        self.info = dict(cover.info)
         self.outfile = outfile
-        self.pixels = deque()
+        self.buffer = rgb_buffer(cover)
+        self.channels = self.buffer.reshape(-1)           # Flat view of the same memory
+        self.cleared = None
+        self.clear_bits = None
+        self.workers = workers
+        self._cursor = 0
+
+    @classmethod
+    def from_cache(cls, cached, outfile, workers=1):
+        """StegImage over a private copy of a LSB_Cache.CachedCover, skipping the decode"""
+        steg_image = cls._from_buffer(cached.buffer.copy(), cached.info, outfile, workers)
+        steg_image.cleared = None if cached.cleared is None else cached.cleared.reshape(-1)
+        steg_image.clear_bits = cached.clear_bits
+        return steg_image
+
+    @classmethod
+    def from_array(cls, array, outfile=None, workers=1):
+        """StegImage over a copy of a (height, width, 3) uint8 RGB array, other arrays are converted through PIL"""
+        if array.ndim != 3 or array.shape[2] != 3 or array.dtype != np.uint8:
+            return cls(Image.fromarray(array).convert('RGB'), outfile, workers)
+        return cls._from_buffer(np.array(array, dtype=np.uint8), {}, outfile, workers)
+
+    @classmethod
+    def _from_buffer(cls, buffer, info, outfile, workers):
+        steg_image = cls.__new__(cls)
+        steg_image.height, steg_image.width = buffer.shape[:2]
+        steg_image.info = dict(info)
+        steg_image.outfile = outfile
+        steg_image.buffer = buffer
+        steg_image.channels = buffer.reshape(-1)
+        steg_image.cleared = None
+        steg_image.clear_bits = None
+        steg_image.workers = workers
+        steg_image._cursor = 0
+        return steg_image
 
     def add_pixels(self, pixels):
-        for pixel in pixels:
-            self.pixels.append(pixel)
-
-    def write_image(self):
-        img = Image.open(self.cover)
-        rgb_cover = img.convert('RGB')
-        pixel_object = rgb_cover.load()
-
-        for y in range(self.height):
-            for x in range(self.width):
-                if self.pixels:
-                    pixel_object[x, y] = self.pixels.popleft()
-                    continue
-                rgb_cover.save(self.outfile)
-                return
+        """Writes pixel tuples into the buffer in raster order, continuing from the previous call"""
+        flat = [channel for pixel in pixels for channel in pixel]
+        self.channels[self._cursor:self._cursor + len(flat)] = flat
+        self._cursor += len(flat)
+
+    def embed(self, payload, offset=0, bits=1, scatter=None):
+        """Embeds payload bytes into the buffer LSBs starting at channel offset, or run by run over the cover as laid
+        out by scatter. Returns the next free offset"""
+        if scatter:
+            embed_scattered(self.channels, payload, 0, scatter, bits, self.workers)
+            return self.channels.size
+        return embed(self.channels, payload, offset, bits, self.cleared if bits == self.clear_bits else None,
+                     self.workers)
+
+    def to_image(self):
+        """PIL image over the buffer (no copy) carrying the cover's metadata"""
+        stego = Image.frombuffer('RGB', (self.width, self.height), self.buffer, 'raw', 'RGB', 0, 1)
+        stego.info = dict(self.info)                      # Keep i.e. icc_profile/transparency as the cover had them
+        return stego
+
+    def write_image(self, options=None):
+        """Saves the buffer through PIL, keeping the cover's metadata. With options (LSB_Writer.OutputOptions) .png
+        and .bmp output is written row by row through LSB_Writer instead, and options.verify reads it back"""
+        if options is not None and os.path.splitext(_file_name(self.outfile))[1].lower() in ('.png', '.bmp'):
+            with open_writer(self.outfile, self.width, self.height, options) as writer:
+                writer.write_image(self.buffer)
+            crc = writer.crc
+        else:
+            self.to_image().save(self.outfile)
+            crc = zlib.crc32(self.buffer) if options is not None and options.verify else None
+        if options is not None and options.verify:
+            verify_output(self.outfile, crc)
 
 
 class HiddenImage:
-    def __init__(self, pixels, height, width, output):
+    def __init__(self, data, height, width, output=None, mode='RGB', name=''):
+        """A restored secret: the payload bytes as embedded, their mode (FILE_MODE for file payloads) and size, and
+        the secret's original file name"""
         self.height = height
         self.width = width
         self.output = output
-        self.pixels = deque(pixels)
+        self.mode = mode
+        self.data = data
+        self.name = name
+
+    def image(self):
+        """The secret as a PIL image"""
+        if self.mode == FILE_MODE:
+            new_img = Image.open(io.BytesIO(self.data))
+            new_img.load()
+            return new_img
+        data = self.data
+        if self.mode == 'P':                              # Native palette payloads carry their palette first
+            palette, data = data[2:2 + int.from_bytes(data[:2], 'big') * 3], data[PALETTE_BYTES:]
+        new_img = Image.frombytes(self.mode, (self.width, self.height), data)
+        if self.mode == 'P':
+            new_img.putpalette(palette)
+        return new_img
+
+    def array(self):
+        """The secret's pixels as an array, (height, width, 3) uint8 for RGB payloads (no copy)"""
+        if self.mode == 'RGB':
+            return np.frombuffer(self.data, dtype=np.uint8).reshape(self.height, self.width, 3)
+        return np.asarray(self.image())
+
+    def tobytes(self, output_format=None):
+        """The secret as the bytes of an image file in output_format (i.e. 'png'), by default the format of its
+        original name. File payloads are returned exactly as embedded unless another format is asked for"""
+        original_ext = os.path.splitext(self.name)[1].lower()
+        extension = f".{output_format.lower().lstrip('.')}" if output_format else original_ext or '.png'
+        if self.mode == FILE_MODE and (not output_format or not original_ext or extension == original_ext):
+            return bytes(self.data)
+        output = _named_buffer('restored', extension)
+        self.write_image(output)
+        return output.getvalue()
+
+    def write_image(self, output=None):
+        """Saves the secret to output, a path or binary file object (defaults to the output given on creation). File
+        payloads are written back byte for byte unless output is of another format"""
+        output = self.output if output is None else output
+        if self.mode == FILE_MODE:
+            _write_secret_file(self.data, os.path.splitext(self.name)[1], output)
+        else:
+            self.image().save(output)
+
+
+class StegoCodec:
+    def __init__(self, bits=1, key=None, payload='rgb', compression=None, level=None, workers=1, strip_height=None,
+                 output_options=None, cover_cache=None, legacy=False, logger=None):
+        """In-memory encoder/decoder. Covers, secrets and stego images can be paths, binary file objects, bytes, PIL
+        images or arrays, and results come back as bytes, PIL images or arrays. Nothing is printed and nothing
+        touches the disk unless a path is passed in, log records go to logger (by default the handler-less
+        LSB_Image.StegoCodec logger). The settings are checked once, a codec can be reused for any number of calls:
+
+          bits            Low bits (1-4) per cover channel the payload is written into, recorded in the header
+          key             Encrypts the payload with the keyed cipher and scatters it over the cover (see LSB_Cipher),
+                          the same key is needed to decode
+          payload         'rgb' the secret's pixels converted to RGB, 'native' its pixels in its own mode (i.e. 1
+                          byte per pixel for grayscale, alpha and palette kept) or 'file' its file bytes as stored,
+                          see LSB_Preflight. The header records the mode, so decoding restores either exactly
+          compression     'zlib' or 'lzma' (see LSB_Codec) compresses the payload at level (0-9) before it is
+                          encrypted, the decoder decompresses it as it extracts
+          workers         Threads the embed/extract is split over in bands, output identical to workers=1
+          strip_height    Streams path covers/stego images in strips of that many rows instead of decoding them
+                          whole (see LSB_Stream)
+          output_options  LSB_Writer.OutputOptions: PNG level/filter or raw BMP writer and verification of the output
+          cover_cache     LSB_Cache.CoverCache keeping decoded path covers between calls
+          legacy          Writes the old ###name###WxH###END trailer layout, the same stego image as reference_encoder
+
+        Every stage is reported to the LSB_Instrument hooks"""
+        if payload not in PAYLOADS:
+            raise ValueError(f"Unknown payload {payload!r}, choose one of {', '.join(PAYLOADS)}")
+        if legacy and (bits != 1 or key is not None or payload != 'rgb' or compression):
+            raise ValueError("The legacy trailer layout only supports 1 bit per channel, no key, no compression and "
+                             "RGB payloads")
+        self.bits = bits
+        self.key = key
+        self.payload = payload
+        self.compression = compression
+        self.workers = workers
+        self.strip_height = strip_height
+        self.output_options = output_options
+        self.cover_cache = cover_cache
+        self.legacy = legacy
+        self.logger = logger or logging.getLogger('LSB_Image.StegoCodec')
+        self.cipher = RotateCipher() if key is None else KeyedCipher(key)
+        self.codec = get_codec(compression, DEFAULT_LEVEL if level is None else level)
+
+    def encode(self, cover, secret, output=None, output_format=None, name=None):
+        """Embeds a binary StegoHeader followed by the secret's payload in one pass over the cover as a uint8 array.
+        The stego image is written to output (a path or binary file object) if given and None returned. Otherwise it
+        is returned in output_format: 'array' ((height, width, 3) uint8), 'image' (PIL) or the extension of a
+        lossless format to get the file's bytes, by default the same kind as the cover ('png' for bytes, paths and
+        files). name is stored in the header, by default the secret's file name. Uncompressed 24 bit BMP covers
+        written to a .bmp path are copied and patched in place through a memory map (see LSB_BMP)"""
+        logger = self.logger
+        cover, secret = _as_source(cover), _as_source(secret)
+        buffer = None
+        if output is None:
+            output_format = (output_format or ('array' if isinstance(cover, np.ndarray) else
+                                               'image' if isinstance(cover, Image.Image) else 'png')).lower()
+            if output_format not in ('array', 'image'):
+                output = buffer = _named_buffer('stego', output_format)
+        if output is not None:
+            check_lossless(output)
+
+        with Stage('encode', 'open_secret') as stage:
+            secret_mode, secret_width, secret_height, secret_array = _load_secret(secret, self.payload)
+            stage.pixels = secret_width * secret_height
+        logger.info(f"Successfully opened secret file {_describe(secret)}")
+
+        if self.codec.codec_id:
+            with Stage('encode', 'compress') as stage:
+                raw_bytes = secret_array.size
+                secret_array = np.frombuffer(self.codec.compress(secret_array.tobytes()), dtype=np.uint8)
+                stage.bits = raw_bytes * 8
+            logger.info(f"Compressed the payload from {raw_bytes} to {secret_array.size} bytes with "
+                        f"{self.compression}")
+
+        with Stage('encode', 'pack') as stage:
+            if self.legacy:
+                trailer_name = name if name is not None else os.fspath(secret) if _is_path(secret) else \
+                    _file_name(secret)
+                metadata = _build_trailer(trailer_name, secret_width, secret_height)
+                logger.info(f"Final Metadata Extracted: {metadata}")
+                segments = [(pack_payload(secret_array, metadata), 0, 1, None)]   # Secret pixels + metadata trailer
+            else:
+                header = StegoHeader(_file_name(secret) if name is None else name, secret_mode, secret_width,
+                                     secret_height, secret_array.size, self.bits, self.cipher.cipher_id,
+                                     self.codec.codec_id)
+                logger.info(f"Header: {header.name} | Mode: {header.mode} | Size: {secret_width}x{secret_height} | "
+                            f"Payload: {header.length} bytes | Bits per channel: {self.bits} | Cipher: "
+                            f"{header.cipher}")
+                scatter = self.cipher.scatter(header.size * 8, _cover_channels(cover)) if self.key is not None \
+                    else None
+                segments = [(encrypt_array(np.frombuffer(header.pack(), dtype=np.uint8)), 0, 1, None),  # 1 bit
+                            (self.cipher.encrypt(secret_array.reshape(-1)), header.size * 8, self.bits, scatter)]
+            payload_bytes = sum(segment[0].size for segment in segments)
+            stage.bits = payload_bytes * 8
+        pixels = _pixels_touched(segments)
+
+        if self.strip_height and _is_path(cover) and output is not None:
+            with Stage('encode', 'stream_embed', pixels, payload_bytes * 8) as stage:
+                stream_embed(cover, output, segments, self.strip_height, self.workers, self.output_options)
+                stage.bytes_written = _file_size(output) if stage.enabled else 0
+            logger.info(f"Streamed {payload_bytes} bytes into {cover} in strips of {self.strip_height} rows")
+        elif _is_path(output) and os.fspath(output).lower().endswith('.bmp') and _is_path(cover) and \
+                is_fast_bmp(cover):
+            with Stage('encode', 'patch', pixels, payload_bytes * 8) as stage:
+                copy_and_patch(cover, output, segments, self.workers)
+                stage.bytes_written = _file_size(output) if stage.enabled else 0
+            logger.info(f"Patched {payload_bytes} bytes into a copy of {cover} (BMP fast path)")
+        else:
+            with Stage('encode', 'open_cover') as stage:
+                steg_image = self._open_cover(cover, output)
+                stage.pixels = steg_image.width * steg_image.height
+            with Stage('encode', 'embed', pixels, payload_bytes * 8):
+                for payload, offset, segment_bits, scatter in segments:
+                    steg_image.embed(payload, offset, segment_bits, scatter)
+            logger.info(f"Embedded {payload_bytes} bytes into {_describe(cover)}")
+            if output is None:
+                return steg_image.buffer if output_format == 'array' else steg_image.to_image()
+            with Stage('encode', 'save') as stage:
+                steg_image.write_image(self.output_options)
+                stage.bytes_written = _file_size(output) if stage.enabled else 0
+        logger.info(f"Successfully Wrote New Image to {_describe(output)}")
+        return None if buffer is None else buffer.getvalue()
+
+    def decode(self, stego):
+        """Reads the binary StegoHeader and then exactly the payload bytes it describes. Stego images without a
+        header fall back to scanning for the legacy ###name###WxH###END trailer, stopping as soon as the trailer is
+        complete. Uncompressed 24 bit BMP paths are read through a memory map, touching only the rows that hold the
+        payload (see LSB_BMP). Returns the secret as a HiddenImage, see its image()/array()/tobytes()/write_image()"""
+        logger = self.logger
+        stego = _as_source(stego)
+        if self.strip_height and _is_path(stego):
+            with Stage('decode', 'stream_extract') as stage:
+                header, image_data, trailer = stream_extract(stego, self.strip_height, self.key, self.workers)
+                stage.pixels, stage.bits = _pixels_read(header, image_data, trailer), len(image_data) * 8
+            logger.info(f"Streamed Stegofile: {stego} in strips of {self.strip_height} rows")
+        elif _is_path(stego) and is_fast_bmp(stego):
+            with BMPImage(stego, workers=self.workers) as channels:
+                logger.info(f"Mapped Stegofile: {stego} (BMP fast path)")
+                with Stage('decode', 'extract') as stage:
+                    header, image_data, trailer = _extract_hidden(channels, logger, self.key)
+                    stage.pixels, stage.bits = _pixels_read(header, image_data, trailer), len(image_data) * 8
+        else:
+            with Stage('decode', 'open_stego') as stage:
+                channels = ChannelArray(_rgb_channels(stego), self.workers)
+                stage.pixels = channels.size // 3
+            logger.info(f"Opened Stegofile: {_describe(stego)}")
+            with Stage('decode', 'extract') as stage:
+                header, image_data, trailer = _extract_hidden(channels, logger, self.key)
+                stage.pixels, stage.bits = _pixels_read(header, image_data, trailer), len(image_data) * 8
+
+        if header and header.mode == CONTAINER_MODE:
+            raise ValueError(f"{_file_name(stego) or 'The stego image'} is a multi-payload container, extract its "
+                             f"payloads with LSB_Container")
+        if header:
+            filename, file_ext = os.path.splitext(header.name)
+            width, height = header.width, header.height
+            logger.info(f"Filename: {filename} | Extension: {file_ext} | Width: {width} | Height: {height} | "
+                        f"Bits per channel: {header.bits}")
+        else:
+            (filename, file_ext, height, width) = _parse_trailer(trailer, logger)
+        return HiddenImage(image_data, height, width, mode=header.mode if header else 'RGB', name=filename + file_ext)
+
+    def _open_cover(self, cover, outfile):
+        """StegImage over a private RGB copy of the cover"""
+        if isinstance(cover, np.ndarray):
+            return StegImage.from_array(cover, outfile, self.workers)
+        if self.cover_cache is not None and _is_path(cover):
+            return StegImage.from_cache(self.cover_cache.get(cover), outfile, self.workers)
+        with _open_image(cover) as image:
+            return StegImage(_load_rgb(image), outfile, self.workers)
+
+
+def rgb_buffer(image, band_rows=64):
+    """Copies an RGB PIL image into a new (height, width, 3) uint8 array, band_rows rows at a time. np.array(image)
+    goes through a tobytes() of the whole image, 3 more bytes per pixel at the peak"""
+    width, height = image.size
+    buffer = np.empty((height, width, 3), dtype=np.uint8)
+    for top in range(0, height, band_rows):
+        bottom = min(top + band_rows, height)
+        band = image.crop((0, top, width, bottom)).tobytes()
+        buffer[top:bottom] = np.frombuffer(band, dtype=np.uint8).reshape(bottom - top, width, 3)
+    return buffer
+
+
+def _load_rgb(image):
+    """Decodes image once as RGB. convert() would make a second full copy of images that are already RGB"""
+    if image.mode == 'RGB':
+        image.load()
+        return image
+    return image.convert('RGB')
 
-    def write_image(self):
-        new_img = Image.new('RGB', (self.width, self.height))
-        pixel_object = new_img.load()
 
-        for y in range(self.height):
-            for x in range(self.width):
-                pixel_object[x, y] = self.pixels.popleft()
+# Encoding---------------------------------------------
 
-        new_img.save(self.output)
-        return
+def encoder(coverimage, secretimage, outfile, legacy=False, strip_height=None, bits=1, key=None, cover_cache=None,
+            workers=1, payload='rgb', compression=None, level=None, output_options=None):
+    """Vectorised encoder. Hides secretimage in coverimage and writes the stego image to outfile, logging to
+    logs/Encoder.log. A thin wrapper around StegoCodec.encode, see StegoCodec for the parameters. The cover, secret
+    and outfile can also be binary file objects (i.e. BytesIO), the secret's and outfile's `name` attribute then gives
+    the name stored in the header and the output format"""
+    codec = StegoCodec(bits, key, payload, compression, level, workers, strip_height, output_options, cover_cache,
+                       legacy, _build_logger_encode())
+    codec.encode(coverimage, secretimage, outfile)
 
 
-# Encoding---------------------------------------------
+def _load_secret(secretimage, payload='rgb'):
+    """Returns (mode, width, height, payload array) of the secret as embedded for payload"""
+    if payload == 'file':
+        if not _is_path(secretimage) and not hasattr(secretimage, 'read'):
+            raise ValueError("File payloads need the secret's file (a path, file object or bytes), not its pixels")
+        info = image_info(secretimage)                    # Only the dimensions, they are recorded in the header
+        if _is_path(secretimage):
+            with open(secretimage, 'rb') as secret_file:
+                data = secret_file.read()
+        else:
+            position = secretimage.tell()
+            data = secretimage.read()
+            secretimage.seek(position)
+        return FILE_MODE, info.width, info.height, np.frombuffer(data, dtype=np.uint8)
+
+    with _open_image(secretimage) as secret:
+        if payload == 'rgb':
+            rgb_secret = secret.convert('RGB')
+            return 'RGB', rgb_secret.width, rgb_secret.height, np.asarray(rgb_secret, dtype=np.uint8)
+
+        mode = native_mode(secret.mode)
+        if mode == 'P' and 'transparency' in secret.info:
+            mode = 'RGBA'                                 # The payload keeps the palette, not its transparency
+        native = secret if secret.mode == mode else secret.convert(mode)
+        data = native.tobytes()
+        if mode == 'P':
+            palette = bytes(native.getpalette() or [])
+            data = (len(palette) // 3).to_bytes(2, 'big') + palette.ljust(PALETTE_BYTES - 2, b'\x00') + data
+        return mode, native.width, native.height, np.frombuffer(data, dtype=np.uint8)
+
+
+def _is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+def _as_source(source):
+    """bytes are read from memory, everything else (paths, file objects, PIL images, arrays) is used as it is"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
+
+def _open_image(source):
+    """Image.open for paths and file objects, PIL images and arrays are used without a decode. Use as a context
+    manager, a PIL image handed in is not closed"""
+    if isinstance(source, Image.Image):
+        return contextlib.nullcontext(source)
+    if isinstance(source, np.ndarray):
+        return contextlib.nullcontext(Image.fromarray(source))
+    return Image.open(source)
+
+
+def _rgb_channels(source):
+    """Flat RGB channels of an image source, without a copy for (height, width, 3) uint8 arrays"""
+    if isinstance(source, np.ndarray) and source.ndim == 3 and source.shape[2] == 3 and source.dtype == np.uint8:
+        return np.ascontiguousarray(source).reshape(-1)
+    with _open_image(source) as image:
+        return rgb_buffer(_load_rgb(image)).reshape(-1)
+
+
+def _cover_channels(cover):
+    """Number of RGB channels of the cover, from the header only for paths and file objects"""
+    if isinstance(cover, Image.Image):
+        return cover.width * cover.height * 3
+    if isinstance(cover, np.ndarray):
+        return cover.shape[0] * cover.shape[1] * 3
+    return image_info(cover).channels
+
+
+def _describe(source):
+    """Path or name of a source for the logs, never its contents"""
+    if _is_path(source):
+        return os.fspath(source)
+    return _file_name(source) or f"<{type(source).__name__}>"
+
+
+def _named_buffer(stem, extension):
+    """Empty BytesIO whose name picks the format PIL and LSB_Writer encode into it"""
+    buffer = io.BytesIO()
+    buffer.name = f"{stem}.{extension.lstrip('.')}"
+    return buffer
+
 
-def encoder(coverimage, secretimage, outfile):
+def _file_name(source):
+    """Base name of a path, or of the `name` a file object carries (empty if it has none)"""
+    return os.path.basename(source if _is_path(source) else getattr(source, 'name', ''))
+
+
+def _file_size(outfile):
+    return os.path.getsize(outfile) if _is_path(outfile) else outfile.tell()
+
+
+def _pixels_touched(segments):
+    """Number of cover pixels the segments write into"""
+    return sum(-(-channels_needed(payload.size, bits) // 3) for payload, offset, bits, scatter in segments)
+
+
+def _build_trailer(secretimage, secret_width, secret_height):
+    """Byte form of the metadata trailer built by _extract_meta (before encryption)"""
+    secret_name, secret_ext = os.path.splitext(secretimage)
+    metadata = "###" + secret_name + secret_ext + "###" + str(secret_width) + "x" + str(secret_height) + "###" + "END"
+    return metadata.encode('utf-8')
+
+
+def reference_encoder(coverimage, secretimage, outfile):
+    """Original pure-Python encoder. Kept as the reference implementation the vectorised encoder is checked against"""
     logger = _build_logger_encode()
 
     with Image.open(coverimage) as cover:
         rgb_cover = cover.convert('RGB')
         cover_width, cover_height = rgb_cover.size
         cover_object = rgb_cover.load()
+        steg_image = StegImage(rgb_cover, outfile)
 
     with Image.open(secretimage) as secret:
         rgb_secret = secret.convert('RGB')
@@ -72,10 +482,10 @@ def encoder(coverimage, secretimage, outfile):
     logger.info(f"Successfully opened files {coverimage} & {secretimage}")
 
     metadata = _extract_meta(secretimage, logger, secret_width, secret_height)
-    logger.info(f"Final Metadata Extracted: {metadata}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Final Metadata Extracted: {metadata}")
 
     cover_pixel_generator = _cover_pixel_generator(cover_width, cover_height, cover_object)
-    steg_image = StegImage(cover_height, cover_width, coverimage, outfile)
     logger.info(f"Successfully Created Stego Object")
 
     for y in range(secret_height):                        # Pull out a single hidden pixel and 24 cover bytes for each
@@ -106,12 +516,14 @@ def _extract_meta(secretimage, logger, secret_width, secret_height):
 
     metadata = metadata.encode('utf-8')
     metadata = bin(int.from_bytes(metadata, 'big'))[2:]
-    logger.info(f"Convert to Binary: {metadata}")
+    if logger.isEnabledFor(logging.DEBUG):                # Binary strings are only worth logging when debugging
+        logger.debug(f"Convert to Binary: {metadata}")
 
     if len(metadata) % 8 != 0:
         padsize = 8 - (len(metadata) % 8)
         metadata = ('0' * padsize) + metadata
-        logger.info(f"Adding Padding: {metadata}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Adding Padding: {metadata}")
 
     metadata = [metadata[idex:idex + 8] for idex in range(0, len(metadata), 8)]  # Split into chunks of 8 to match
     for idex, byte in enumerate(metadata):
@@ -149,7 +561,120 @@ def _cover_pixel_generator(cover_width, cover_height, cover_object):
 
 # Decoding---------------------------------------------
 
-def decoder(stegofile, outfile):
+def decoder(stegofile, outfile, strip_height=None, key=None, workers=1):
+    """Vectorised decoder. Restores the image hidden in stegofile to outfile, logging to logs/Decoder.log and
+    printing a summary. A thin wrapper around StegoCodec.decode, see StegoCodec for the parameters. stegofile and
+    outfile can also be binary file objects, see encoder. Returns the original name of the hidden image"""
+    logger = _build_logger_decode()
+    restored_image = StegoCodec(key=key, workers=workers, strip_height=strip_height, logger=logger).decode(stegofile)
+
+    with Stage('decode', 'save') as stage:
+        restored_image.write_image(outfile)
+        stage.bytes_written = _file_size(outfile) if stage.enabled else 0
+
+    filename, file_ext = os.path.splitext(restored_image.name)
+    logger.info(f"Successfully created restored Image: {outfile}")
+    print(f"Completed. Restored Hidden image: {outfile} | Original filename: {filename} | Original Ext: {file_ext}")
+    return restored_image.name
+
+
+def _write_secret_file(data, file_ext, outfile):
+    """Writes the secret's original file bytes as they are, or converted by PIL if outfile is of another format (a
+    secret without an extension is always written as it is)"""
+    out_ext = os.path.splitext(_file_name(outfile))[1].lower()
+    if out_ext and file_ext and out_ext != file_ext.lower():
+        with Image.open(io.BytesIO(data)) as secret:
+            secret.save(outfile)
+    elif _is_path(outfile):
+        with open(outfile, 'wb') as output_file:
+            output_file.write(data)
+    else:
+        outfile.write(data)
+
+
+def _pixels_read(header, image_data, trailer):
+    """Number of stego pixels the hidden data was read from"""
+    if header:
+        return -(-(header.size * 8 + channels_needed(header.length, header.bits)) // 3)
+    return -(-(len(image_data) + len(trailer)) * 8 // 3)
+
+
+def _extract_hidden(stego, logger, key=None):
+    """Returns (StegoHeader, payload bytes, None), or (None, image bytes, trailer bytes) for legacy stego images.
+    stego is anything with size/extract, i.e. ChannelArray or BMPImage"""
+    header, offset = _read_header(stego)
+    if header:
+        cipher = get_cipher(header.cipher, key)
+        scatter = cipher.scatter(offset, stego.size)
+        decompressor = get_codec(header.codec).decompressor(restored_size(header))
+        if header.codec and not scatter:
+            return header, _extract_compressed(stego, header, offset, cipher, decompressor), None
+        data = cipher.decrypt(stego.extract(header.length, offset, header.bits, scatter)).tobytes()
+        return header, decompressor.decompress(data) + decompressor.flush(), None
+
+    logger.info(f"No stego header found, reading legacy metadata trailer")
+    return (None,) + _scan_trailer(stego)
+
+
+def _extract_compressed(stego, header, offset, cipher, decompressor, chunk_size=1 << 20):
+    """Extracts a compressed payload chunk by chunk, decompressing each chunk as soon as it is read"""
+    chunk_bytes = chunk_size - chunk_size % header.bits   # Every chunk starts on a whole group of channels
+    restored = bytearray()
+    position = 0
+    while position < header.length:
+        nbytes = min(chunk_bytes, header.length - position)
+        chunk = stego.extract(nbytes, offset + channels_needed(position, header.bits), header.bits)
+        restored += decompressor.decompress(cipher.decrypt(chunk, position))
+        position += nbytes
+    restored += decompressor.flush()
+    return restored
+
+
+def _read_header(stego):
+    """Returns (StegoHeader, channel offset of the payload), or (None, 0) if the image has no binary header"""
+    if stego.size < FIXED_SIZE * 8:
+        return None, 0
+
+    fixed = decrypt_array(stego.extract(FIXED_SIZE)).tobytes()
+    if not has_magic(fixed):
+        return None, 0
+
+    header, name_len = StegoHeader.unpack_fixed(fixed)
+    header.name = decrypt_array(stego.extract(name_len, FIXED_SIZE * 8)).tobytes().decode('utf-8')
+
+    offset = header.size * 8
+    if offset + channels_needed(header.length, header.bits) > stego.size:
+        raise ValueError(f"Header describes {header.length} payload bytes, more than the stego image can hold")
+    return header, offset
+
+
+def _scan_trailer(stego, chunk_size=4096):
+    """Extracts and decrypts the hidden bytes in growing chunks, feeding each to a TrailerScanner until the trailer is
+    complete. Returns (image bytes, trailer bytes)"""
+    scanner = TrailerScanner()
+    available = stego.size // 8
+    read = 0
+
+    while read < available:
+        nbytes = min(chunk_size, available - read)
+        chunk = stego.extract(nbytes, read * 8)
+        read += nbytes
+        chunk_size *= 2
+        if scanner.feed(decrypt_array(chunk).tobytes()):
+            return scanner.split()
+
+    raise ValueError("No hidden metadata found in stego image")
+
+
+def _parse_trailer(trailer, logger):
+    """Byte form of _extract_metadata. Pulls the filename, extension and size out of ###name.ext###WxH###END"""
+    file_name, file_extension, width, height = parse_trailer(trailer)
+    logger.info(f"Filename: {file_name} | Extension: {file_extension} | Width: {width} | Height: {height}")
+    return file_name, file_extension, height, width
+
+
+def reference_decoder(stegofile, outfile):
+    """Original pure-Python decoder. Kept as the reference implementation the vectorised decoder is checked against"""
     logger = _build_logger_decode()
     delim = False
     extracted_data = []
@@ -174,6 +699,7 @@ def decoder(stegofile, outfile):
                                                                 # have all the hidden data
 
     (image_data, filename, file_ext, height, width) = _extract_metadata(extracted_data, logger)
+    image_data = bytes(channel for pixel in image_data for channel in pixel)
     restored_image = HiddenImage(image_data, height, width, outfile)
     restored_image.write_image()
 
@@ -198,9 +724,6 @@ def _hidden_data_extraction(pixels):
 
 def _extract_metadata(extracted_pixels, logger):
     """This functions extracts the filename, extension, pixels, width and height from the hidden data"""
-    regex_ext = re.compile(r'\.\w{3,}$')
-    regex_name = re.compile(r'(?<=\\)[\w\s]+(?=\.)')
-
     # Isolates the data related to the hidden image itself
     meta_idex_start = extracted_pixels.index((35, 35, 35))
     image_data = extracted_pixels[:meta_idex_start]
@@ -210,10 +733,9 @@ def _extract_metadata(extracted_pixels, logger):
     metadata = " ".join(metadata).split("35 35 35")
     meta_filename_ext, meta_size = metadata[0].strip(" ").split(" "), metadata[1].strip(" ").split(" ")
 
-    # Logic to pull out file name and extension via regex
+    # Logic to pull out file name and extension
     filename_ext_data = "".join([chr(int(num)) for num in meta_filename_ext])
-    file_extension = regex_ext.search(filename_ext_data).group()
-    file_name = regex_name.search(filename_ext_data).group()
+    file_name, file_extension = split_trailer_name(filename_ext_data)
 
     # Logic to pull out file size
     filesize_data = "".join([chr(int(num)) for num in meta_size])
@@ -248,47 +770,19 @@ def _check_meta(extracted_pixels):
 # Cryptography---------------------------------------------
 
 def encryption(byte):
-    byte_stack = deque(byte)
-    byte_stack.rotate(3)
-    return "".join(byte_stack)
+    """Rotates an 8 character bit string right by 3 bits. One lookup in the 256 entry table instead of a deque"""
+    return STRING_TABLE[byte]
 
 def decryption(byte):
-    byte_stack = deque(byte)
-    byte_stack.rotate(-3)
-    return "".join(byte_stack)
+    return STRING_TABLE_INVERSE[byte]
 
 
 # Loggers---------------------------------------------
 
 def _build_logger_encode():
-    directory = os.path.dirname(os.path.abspath(__file__))
-    os.chdir(directory)
-
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.INFO)
-
-    file_handler_info = RotatingFileHandler('../logs/Encoder.log', maxBytes=1048576)
-    file_handler_info.setLevel(logging.INFO)
-
-    formatter = logging.Formatter('%(asctime)s || %(levelname)s || %(message)s || %(name)s')
-    file_handler_info.setFormatter(formatter)
-    logger.addHandler(file_handler_info)
-
-    return logger
+    """Configured once per process by LSB_Instrument, repeated calls return the same logger without new handlers"""
+    return get_logger('Encoder')
 
 
 def _build_logger_decode():
-    directory = os.path.dirname(os.path.abspath(__file__))
-    os.chdir(directory)
-
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.INFO)
-
-    file_handler_info = RotatingFileHandler('../logs/Decoder.log', maxBytes=1048576)
-    file_handler_info.setLevel(logging.INFO)
-
-    formatter = logging.Formatter('%(asctime)s || %(levelname)s || %(message)s || %(name)s')
-    file_handler_info.setFormatter(formatter)
-    logger.addHandler(file_handler_info)
-
-    return logger
+    return get_logger('Decoder')
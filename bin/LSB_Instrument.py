@@ -0,0 +1,133 @@
+import logging
+import os
+import time
+
+from logging.handlers import RotatingFileHandler
+
+"""
+LSB_Instrument.py
+
+Logging and per-stage instrumentation shared by the encoder and decoder.
+
+Logging: get_logger('Encoder') / get_logger('Decoder') return loggers writing to logs/Encoder.log and logs/Decoder.log
+next to bin/. Handlers are attached once per process, no matter how often the loggers are asked for, and the log
+directory is addressed by absolute path, so the working directory is never changed. Large payloads (binary strings,
+whole metadata lists) are only logged at DEBUG, which is off unless configure_logging(debug=True) is called.
+
+Instrumentation: the encoder and decoder wrap each of their stages in `with Stage(operation, name, ...)`. Every
+stage that completes is reported as one record dict to the subscribed hooks:
+
+  {'operation': 'encode', 'stage': 'embed', 'seconds': 0.0021, 'pixels': 1228800, 'bits': 921928, 'bytes_written': 0}
+
+  pixels         Cover/stego pixels the stage processed
+  bits           Payload bits embedded or extracted
+  bytes_written  Bytes written to disk
+
+Subscribe with subscribe(hook) / unsubscribe(hook), or collect the records of a block with:
+
+  with Collector() as records:
+      encoder(cover, secret, out)
+
+With no hooks subscribed a stage is a no-op apart from one truthiness check on entry and exit.
+"""
+
+_log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
+_LOGGERS = {'Encoder': 'Encoder.log', 'Decoder': 'Decoder.log'}
+_configured = {}
+_debug = False
+_hooks = []
+
+
+# Logging---------------------------------------------
+
+def configure_logging(debug=False, log_dir=None):
+    """(Re)configures the Encoder/Decoder loggers. debug=True also logs the large DEBUG payloads. log_dir defaults to
+    the repository's logs directory. Safe to call any number of times, existing handlers are replaced, not added to"""
+    global _debug, _log_dir
+    _debug = debug
+    if log_dir:
+        _log_dir = os.path.abspath(log_dir)
+    for logger in _configured.values():
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            handler.close()
+    _configured.clear()
+    return [get_logger(kind) for kind in _LOGGERS]
+
+
+def get_logger(kind):
+    """Returns the Encoder or Decoder logger, attaching its rotating file handler on first use only"""
+    logger = _configured.get(kind)
+    if logger is not None:
+        return logger
+
+    logger = logging.getLogger(f"LSB_Image.{kind}")
+    logger.setLevel(logging.DEBUG if _debug else logging.INFO)
+    os.makedirs(_log_dir, exist_ok=True)
+
+    file_handler_info = RotatingFileHandler(os.path.join(_log_dir, _LOGGERS[kind]), maxBytes=1048576)
+    file_handler_info.setLevel(logging.DEBUG)
+
+    formatter = logging.Formatter('%(asctime)s || %(levelname)s || %(message)s || %(name)s')
+    file_handler_info.setFormatter(formatter)
+    logger.addHandler(file_handler_info)
+
+    _configured[kind] = logger
+    return logger
+
+
+# Instrumentation---------------------------------------------
+
+def subscribe(hook):
+    """Calls hook(record) for every completed stage from now on"""
+    _hooks.append(hook)
+
+
+def unsubscribe(hook):
+    _hooks.remove(hook)
+
+
+class Collector:
+    def __init__(self):
+        """Context manager collecting the stage records emitted inside the block into a list"""
+        self.records = []
+        self._hook = self.records.append
+
+    def __enter__(self):
+        subscribe(self._hook)
+        return self.records
+
+    def __exit__(self, *exc):
+        unsubscribe(self._hook)
+
+
+class Stage:
+    __slots__ = ('operation', 'name', 'pixels', 'bits', 'bytes_written', '_start')
+
+    def __init__(self, operation, name, pixels=0, bits=0, bytes_written=0):
+        """Times one stage of operation. Counters can also be set on the stage object inside the block, check
+        .enabled first if working out a counter costs anything"""
+        self.operation = operation
+        self.name = name
+        self.pixels = pixels
+        self.bits = bits
+        self.bytes_written = bytes_written
+        self._start = None
+
+    @property
+    def enabled(self):
+        return self._start is not None
+
+    def __enter__(self):
+        if _hooks:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if self._start is None or exc_type is not None:
+            return
+        record = {'operation': self.operation, 'stage': self.name,
+                  'seconds': round(time.perf_counter() - self._start, 6), 'pixels': self.pixels, 'bits': self.bits,
+                  'bytes_written': self.bytes_written}
+        for hook in list(_hooks):
+            hook(record)
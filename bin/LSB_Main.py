@@ -1,8 +1,6 @@
-import pyfiglet
-import termcolor
+import sys
 
-from LSB_Args import check_args
-from LSB_Image import encoder, decoder
+from LSB_Args import check_args, check_batch_args, check_container_args, check_scan_args, check_serve_args
 from time import sleep
 
 """
@@ -15,6 +13,29 @@ Usage:
   If Decoding:
   LSB_Main.py -f <stegofile> -o <hidden output file>
   
+  If Scripting (non-interactive, no banner/menu/sleeps):
+  LSB_Main.py encode -c <coverfile> -s <secretfile> -o <outputfile> [--strip-height <rows>] [--bits <1-4>]
+                    [--key <key>] [--workers <threads>] [--payload <rgb|native|file>]
+                    [--compress <zlib|lzma>] [--level <0-9>] [--png-level <0-9>]
+                    [--png-filter <none|sub|up|average|paeth|adaptive>] [--verify-output]
+  LSB_Main.py decode -f <stegofile> -o <hidden output file> [--strip-height <rows>] [--key <key>]
+                    [--workers <threads>]
+  
+  If Batch Processing (non-interactive):
+  LSB_Main.py batch <manifest.csv|manifest.jsonl> [-w <workers>] [--summary <summary.json>]
+  
+  If Scanning (non-interactive, lists which images carry a payload):
+  LSB_Main.py scan <directory|image> [...] [-o <report.jsonl>] [-w <workers>] [--legacy-bytes <n>]
+  
+  If Using Multi-Payload Containers (non-interactive):
+  LSB_Main.py container create -c <coverfile> -o <containerfile> [--slots <n>]
+  LSB_Main.py container add -f <containerfile> -i <any file> [-n <name>] [-o <outputfile>] [--bits <1-4>] [--key <key>]
+  LSB_Main.py container list -f <containerfile>
+  LSB_Main.py container extract -f <containerfile> -n <name> -o <output file> [--key <key>]
+  
+  If Serving (local HTTP service, images in memory):
+  LSB_Main.py serve [--host <host>] [--port <port> | --unix <socket path>] [-w <workers>] [--queue-limit <n>]
+  
 Options:
   -h, --help                Show this help
   
@@ -48,6 +69,21 @@ class Bcolours:
 
 
 def main():
+    subcommands = {
+        "encode": _encode_direct,
+        "decode": _decode_direct,
+        "batch": _batch,
+        "scan": _scan,
+        "serve": _serve,
+        "container": _container
+    }
+    if len(sys.argv) > 1 and sys.argv[1] in subcommands:
+        subcommands[sys.argv[1]](sys.argv[2:])
+        return
+
+    import pyfiglet                                       # Only the interactive menu needs these
+    import termcolor
+
     ascii_title = pyfiglet.figlet_format("LSB Steganography", font="slant")
     print(termcolor.colored(ascii_title, color='cyan'))
 
@@ -79,9 +115,9 @@ def _encode_image():
     args = check_args(True)
 
     if not args:
-        print(f"{Bcolours.FAIL}The cover image must be slightly larger than 8x the size (in bytes) than the secret "
-              f"image. (Must accommodate entirety of secret image in LSB + Metadata) Please "
-              f"input different images for the arguments or check file size")
+        print(f"{Bcolours.FAIL}The cover image needs slightly more than 8x the pixels of the secret image. (Must "
+              f"accommodate entirety of secret image in LSB + Metadata) Please "
+              f"input different images for the arguments or check image dimensions")
         quit(1)
 
     print(f"{Bcolours.OKGREEN}Success. Starting program...")
@@ -89,7 +125,10 @@ def _encode_image():
     print(f"{Bcolours.OKGREEN}Parameters Inputted: Cover Image: {args.cover} | Secret Image: {args.secret} | "
           f"Output File: {args.output}")
 
-    encoder(args.cover, args.secret, args.output)
+    from LSB_Image import encoder
+    encoder(args.cover, args.secret, args.output, strip_height=args.strip_height, bits=args.bits,
+            key=args.key, workers=args.workers, payload=args.payload,
+            compression=args.compress, level=args.level, output_options=_output_options(args))
 
 
 def _decode_image():
@@ -102,7 +141,81 @@ def _decode_image():
     print(f"{Bcolours.OKGREEN}Parameters Inputted: Stego File: {args.stegofile} | "
           f"Output File: {args.output}")
 
-    decoder(args.stegofile, args.output)
+    from LSB_Image import decoder
+    decoder(args.stegofile, args.output, strip_height=args.strip_height, key=args.key, workers=args.workers)
+
+
+# Subcommands (scripted, no banner/menu/sleeps) ---------------------------------------------
+
+def _encode_direct(argv):
+    args = check_args(True, argv)
+    if not args:
+        print(f"The cover image is too small to hold the secret image + metadata", file=sys.stderr)
+        quit(1)
+
+    from LSB_Image import encoder                         # Heavy imports (numpy/PIL) only once the args are valid
+    encoder(args.cover, args.secret, args.output, strip_height=args.strip_height, bits=args.bits,
+            key=args.key, workers=args.workers, payload=args.payload,
+            compression=args.compress, level=args.level, output_options=_output_options(args))
+
+
+def _output_options(args):
+    """LSB_Writer.OutputOptions from the encode arguments, None (PIL's defaults) unless any was given"""
+    if args.png_level is None and args.png_filter is None and not args.verify_output:
+        return None
+    from LSB_Writer import DEFAULT_LEVEL, OutputOptions
+    return OutputOptions(DEFAULT_LEVEL if args.png_level is None else args.png_level, args.png_filter or 'none',
+                         args.workers, args.verify_output)
+
+
+def _decode_direct(argv):
+    args = check_args(False, argv)
+
+    from LSB_Image import decoder
+    decoder(args.stegofile, args.output, strip_height=args.strip_height, key=args.key, workers=args.workers)
+
+
+def _batch(argv):
+    args = check_batch_args(argv)
+
+    from LSB_Batch import batch
+    summary = batch(args.manifest, args.workers, args.summary)
+    quit(1 if summary['failed'] else 0)
+
+
+def _scan(argv):
+    args = check_scan_args(argv)
+
+    from LSB_Scan import scan
+    scan(args.targets, args.report, args.workers, args.legacy_bytes)
+
+
+def _serve(argv):
+    args = check_serve_args(argv)
+
+    from LSB_Service import serve
+    serve(args.host, args.port, args.unix, args.workers, args.queue_limit)
+
+
+def _container(argv):
+    args = check_container_args(argv)
+
+    import LSB_Container
+    if args.action == 'create':
+        free_channels = LSB_Container.create_container(args.cover, args.output, args.slots, args.workers)
+        print(f"Completed. Created container with {args.slots} slots: {args.output} | {free_channels // 8} bytes "
+              f"free at 1 bit per channel")
+    elif args.action == 'add':
+        entry, free_channels = LSB_Container.add_payload(args.stegofile, args.input, args.name, args.output,
+                                                         args.bits, args.key, args.workers)
+        print(f"Completed. Added {entry.name} ({entry.length} bytes) to container: {args.output or args.stegofile} | "
+              f"{free_channels * args.bits // 8} bytes left at {args.bits} bits per channel")
+    elif args.action == 'extract':
+        data = LSB_Container.extract_payload(args.stegofile, args.name, args.output, args.key, args.workers)
+        print(f"Completed. Extracted {args.name} ({len(data)} bytes) to: {args.output}")
+    else:
+        for entry in LSB_Container.list_payloads(args.stegofile):
+            print(f"{entry.name}\t{entry.length} bytes\t{entry.bits} bit(s)\t{entry.mode}")
 
 
 # Menu Printing ---------------------------------------------
@@ -136,8 +249,8 @@ def _print_help():
     print(f"\n{Bcolours.UNDERLINE}{Bcolours.BOLD}Encoding{Bcolours.ENDC}")
     print(f"\n{Bcolours.UNDERLINE}{Bcolours.OKBLUE}Description{Bcolours.ENDC}")
     print(f"{Bcolours.OKBLUE}Takes in required parameters of -c/--cover, -o/--output and -s/--secret. -c refers to "
-          f"the image that will be used to hide the secret image. Must be slightly larger than 8x the size of the "
-          f"secret image, in bytes. -s refers to the secret image that will be hidden within the cover image. -o "
+          f"the image that will be used to hide the secret image. Must have slightly more than 8x the pixels of the "
+          f"secret image. -s refers to the secret image that will be hidden within the cover image. -o "
           f"refers to the resultant stego file that contains the hidden information{Bcolours.ENDC}")
     print(f"\n{Bcolours.UNDERLINE}{Bcolours.OKBLUE}Usage{Bcolours.ENDC}")
     print(f"{Bcolours.OKBLUE}LSB_Main.py -c Coverfile.bmp -s Hiddenfile.bmp -o stegofile.bmp{Bcolours.ENDC}")
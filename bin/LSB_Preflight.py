@@ -0,0 +1,193 @@
+import os
+import struct
+
+from LSB_Header import FILE_MODE, FIXED_SIZE
+
+"""
+LSB_Preflight.py
+
+Header-only capacity checks. Reads the dimensions and mode of an image from its header (PNG IHDR / BMP info header,
+any other format through PIL, which also only parses the header on open) without decoding a single pixel, and works
+out exactly how many cover channels an encode needs:
+
+  header channels   8 per byte of StegoHeader (fixed part + name), always embedded at 1 bit per channel
+  payload channels  ceil(payload bits / bits per channel). Keyed payloads start on the first whole pixel after the
+                    header and are scattered in whole runs of RUN_PIXELS pixels (see LSB_Cipher.PixelScatter), so
+                    they are rounded up to whole runs
+
+The payload size depends on how the secret is embedded (see LSB_Image.encoder):
+  rgb     3 bytes per pixel, the secret converted to RGB (default)
+  native  The pixels in the secret's own mode (NATIVE_MODES), i.e. 1 byte per pixel for grayscale, plus the palette
+          for palette images. Other modes are embedded as RGB, or RGBA if they have alpha (as are palette images
+          with a transparent colour, which the header check cannot see)
+  file    The secret's file bytes as stored on disk
+
+Usable as a library call, i.e. to triage a directory of candidate covers for one secret:
+
+  reports = triage(glob.glob('covers/*.png'), 'secret.bmp')
+  usable = [report.cover for report in reports if report.fits]
+"""
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_MODES = {(0, 1): '1', (0, 8): 'L', (0, 16): 'I;16', (2, 8): 'RGB', (2, 16): 'RGB;16', (3, 8): 'P', (4, 8): 'LA',
+              (6, 8): 'RGBA', (6, 16): 'RGBA;16'}
+_BMP_MODES = {1: '1', 4: 'P', 8: 'P', 16: 'RGB', 24: 'RGB', 32: 'RGB'}
+
+PAYLOADS = ['rgb', 'native', 'file']
+NATIVE_MODES = {'1': 1, 'L': 8, 'P': 8, 'LA': 16, 'I;16': 16, 'RGB': 24, 'RGBA': 32, 'I': 32, 'F': 32}   # Bits/pixel
+PALETTE_BYTES = 2 + 768                                   # Entry count + the palette padded to 256 RGB entries
+MAX_FILE_BYTES = 256 * 1024 * 1024                        # Restored size ceiling for compressed file payloads
+
+
+# Classes ----------------------------
+
+class ImageInfo:
+    def __init__(self, path, image_format, mode, width, height):
+        self.path = path
+        self.format = image_format
+        self.mode = mode
+        self.width = width
+        self.height = height
+
+    @property
+    def channels(self):
+        """Number of RGB channels once converted to RGB, which is what gets embedded into / extracted from"""
+        return self.width * self.height * 3
+
+
+class CapacityReport:
+    def __init__(self, cover, secret, capacity_channels, required_channels, bits=1, error=None):
+        self.cover = cover
+        self.secret = secret
+        self.capacity_channels = capacity_channels
+        self.required_channels = required_channels
+        self.bits = bits
+        self.error = error
+
+    @property
+    def fits(self):
+        return self.error is None and self.required_channels <= self.capacity_channels
+
+    @property
+    def spare_bits(self):
+        """Payload bits still free in the cover after this encode (negative when it does not fit)"""
+        return (self.capacity_channels - self.required_channels) * self.bits
+
+
+# Headers---------------------------------------------
+
+def image_info(path):
+    """Returns the ImageInfo of path from its header only. Raises ValueError if it is not a readable image. path
+    can also be a seekable binary file object, which is left at the position it was at"""
+    if hasattr(path, 'read'):
+        position = path.tell()
+        head = path.read(64)
+        path.seek(position)
+    else:
+        with open(path, 'rb') as image_file:
+            head = image_file.read(64)
+
+    if head.startswith(_PNG_SIGNATURE) and head[12:16] == b'IHDR':
+        width, height, depth, colour = struct.unpack('>IIBB', head[16:26])
+        return ImageInfo(path, 'png', _PNG_MODES.get((colour, depth), f"colour type {colour}"), width, height)
+
+    if head.startswith(b'BM') and len(head) >= 30:
+        dib_size = struct.unpack('<I', head[14:18])[0]
+        if dib_size == 12:                                # OS/2 BITMAPCOREHEADER
+            width, height, _, bit_count = struct.unpack('<HHHH', head[18:26])
+        else:
+            width, height, _, bit_count = struct.unpack('<iiHH', head[18:30])
+        return ImageInfo(path, 'bmp', _BMP_MODES.get(bit_count, f"{bit_count} bit"), width, abs(height))
+
+    from PIL import Image, UnidentifiedImageError      # Other formats: PIL only parses the header on open
+    try:
+        with Image.open(path) as image:
+            return ImageInfo(path, image.format.lower(), image.mode, image.width, image.height)
+    except UnidentifiedImageError:
+        raise ValueError(f"{path} is not a recognised image file")
+    finally:
+        if hasattr(path, 'seek'):
+            path.seek(position)
+
+
+def native_mode(mode):
+    """Mode a secret of this (PIL or image_info) mode is embedded in as a native payload"""
+    if mode in NATIVE_MODES:
+        return mode
+    if mode.startswith('I;16'):
+        return 'I;16'
+    return 'RGBA' if 'A' in mode.split(';')[0] else 'RGB'  # i.e. RGB;16 and RGBA;16 are read as 8 bit by PIL
+
+
+def native_size(mode, width, height):
+    """Payload bytes of a native payload, rows of 1 bit images are padded to whole bytes"""
+    size = -(-width * NATIVE_MODES[mode] // 8) * height
+    return size + PALETTE_BYTES if mode == 'P' else size
+
+
+def restored_size(header):
+    """Most bytes the payload of a StegoHeader restores to: the exact size of an image payload, MAX_FILE_BYTES for
+    file payloads (and any other mode), whose restored size the header does not record"""
+    if header.mode != FILE_MODE and header.mode in NATIVE_MODES:
+        return native_size(header.mode, header.width, header.height)
+    return MAX_FILE_BYTES
+
+
+# Capacity---------------------------------------------
+
+def payload_size(secret, payload='rgb'):
+    """Number of payload bytes secret (path or ImageInfo) is embedded as, see PAYLOADS"""
+    info = secret if isinstance(secret, ImageInfo) else image_info(secret)
+    if payload == 'rgb':
+        return info.channels
+    if payload == 'native':
+        return native_size(native_mode(info.mode), info.width, info.height)
+    if payload == 'file':
+        if not hasattr(info.path, 'seek'):
+            return os.path.getsize(info.path)
+        position = info.path.tell()
+        size = info.path.seek(0, os.SEEK_END)
+        info.path.seek(position)
+        return size
+    raise ValueError(f"Unknown payload {payload!r}, choose one of {', '.join(PAYLOADS)}")
+
+
+def required_channels(secret, bits=1, payload='rgb', keyed=False):
+    """Number of cover channels an encode of secret (path or ImageInfo) needs, at bits per channel. keyed is True
+    for encodes with a key, whose payload is scattered in whole runs"""
+    info = secret if isinstance(secret, ImageInfo) else image_info(secret)
+    header_channels = (FIXED_SIZE + len(os.path.basename(info.path).encode('utf-8'))) * 8
+    payload_channels = -(-payload_size(info, payload) * 8 // bits)
+    if not keyed:
+        return header_channels + payload_channels
+
+    from LSB_Cipher import RUN_PIXELS                     # numpy, only paid for keyed checks
+    run_channels = RUN_PIXELS * 3
+    return -(-header_channels // 3) * 3 + -(-payload_channels // run_channels) * run_channels
+
+
+def check_capacity(coverimage, secretimage, bits=1, payload='rgb', keyed=False):
+    """Returns a CapacityReport for embedding secretimage into coverimage. Capacity is counted in cover channels, each
+    of which holds one header bit or `bits` payload bits"""
+    secret = image_info(secretimage)
+    needed = required_channels(secret, bits, payload, keyed)
+    try:
+        cover = image_info(coverimage)
+    except (OSError, ValueError) as error:
+        return CapacityReport(coverimage, secretimage, 0, needed, bits, str(error))
+    return CapacityReport(coverimage, secretimage, cover.channels, needed, bits)
+
+
+def triage(coverimages, secretimage, bits=1, payload='rgb', keyed=False):
+    """Checks every candidate cover against one secret. The secret header is only read once. Unreadable covers are
+    reported with an error instead of raising"""
+    secret = image_info(secretimage)
+    needed = required_channels(secret, bits, payload, keyed)
+
+    reports = []
+    for coverimage in coverimages:
+        try:
+            reports.append(CapacityReport(coverimage, secretimage, image_info(coverimage).channels, needed, bits))
+        except (OSError, ValueError) as error:
+            reports.append(CapacityReport(coverimage, secretimage, 0, needed, bits, str(error)))
+    return reports
@@ -0,0 +1,99 @@
+import contextlib
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+LSB_Scan.py
+
+Bulk detection of stego images, for auditing directories of many thousands of files without decoding any payload.
+Every image is read only up to the end of its stego header, which for a binary header is the first row or two: raw
+BMP/TIFF/PPM rows are read straight from the file and PNG IDAT is only inflated as far as needed (see
+LSB_Stream.StripReader). Images without a header are searched for the legacy ###name###WxH###END trailer within their
+first legacy_bytes hidden bytes, a legacy trailer further in is not found (the trailer follows the hidden image, so it
+can only be found by reading that far).
+
+Files are scanned on a process pool and reported one JSON object per line, in the order they were listed:
+
+  {"path": "a/Out.png", "has_payload": true, "format": "header", "name": "Secret.png", "mode": "RGB",
+   "width": 70, "height": 90, "length": 18900, "bits": 1, "keyed": false, "compressed": false, "error": null}
+
+format is "header", "container" (see LSB_Container) or "legacy". Unreadable files get has_payload false and the
+error message.
+"""
+
+IMAGE_EXTENSIONS = ('.bmp', '.png', '.tif', '.tiff', '.ppm', '.pgm', '.pnm', '.gif', '.webp')
+DEFAULT_LEGACY_BYTES = 64 * 1024
+
+_CHUNK_FILES = 64                                         # Files handed to a worker at a time
+
+
+def scan_file(path, legacy_bytes=DEFAULT_LEGACY_BYTES):
+    """Checks a single image for a payload. Never raises, a failure is returned in the result"""
+    from LSB_Header import CONTAINER_MODE, parse_trailer
+    from LSB_Stream import stream_header
+    result = {'path': path, 'has_payload': False, 'format': None, 'name': None, 'mode': None, 'width': None,
+              'height': None, 'length': None, 'bits': None, 'keyed': None, 'compressed': None, 'error': None}
+    try:
+        header, trailer = stream_header(path, trailer_bytes=legacy_bytes)
+    except Exception as error:
+        result['error'] = f"{type(error).__name__}: {error}"
+        return result
+
+    if header:
+        result.update(has_payload=True, format='container' if header.mode == CONTAINER_MODE else 'header',
+                      name=header.name, mode=header.mode, width=header.width, height=header.height,
+                      length=header.length, bits=header.bits, keyed=header.cipher != 0, compressed=header.codec != 0)
+    elif trailer:
+        file_name, file_extension, width, height = parse_trailer(trailer)
+        result.update(has_payload=True, format='legacy', name=file_name + file_extension, mode='RGB', width=width,
+                      height=height, length=width * height * 3, bits=1, keyed=False, compressed=False)
+    return result
+
+
+def find_images(targets, extensions=IMAGE_EXTENSIONS):
+    """Expands the files and directories in targets (recursively) into image paths, in a stable order"""
+    paths = []
+    for target in targets:
+        if not os.path.isdir(target):
+            paths.append(target)
+            continue
+        for root, dirs, files in os.walk(target):
+            dirs.sort()
+            paths.extend(os.path.join(root, file) for file in sorted(files)
+                         if os.path.splitext(file)[1].lower() in extensions)
+    return paths
+
+
+def run_scan(paths, workers=None, legacy_bytes=DEFAULT_LEGACY_BYTES, report=None):
+    """Scans paths on a pool of worker processes, calling report with every result in path order. Returns the
+    summary"""
+    start = time.perf_counter()
+    found = errors = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(scan_file, paths, [legacy_bytes] * len(paths), chunksize=_CHUNK_FILES)
+        for result in results:
+            found += result['has_payload']
+            errors += result['error'] is not None
+            if report:
+                report(result)
+
+    elapsed = time.perf_counter() - start
+    return {'files': len(paths), 'with_payload': found, 'errors': errors, 'elapsed_seconds': round(elapsed, 3),
+            'files_per_minute': round(len(paths) / elapsed * 60, 1) if elapsed else 0.0}
+
+
+def scan(targets, report=None, workers=None, legacy_bytes=DEFAULT_LEGACY_BYTES):
+    """Entry point for the scan subcommand. Writes the JSONL report to the report file, or to stdout, and prints the
+    summary to stderr. Returns the summary"""
+    paths = find_images(targets)
+    with open(report, 'w') if report else contextlib.nullcontext(sys.stdout) as report_file:
+        summary = run_scan(paths, workers, legacy_bytes,
+                           report=lambda result: report_file.write(json.dumps(result) + "\n"))
+
+    print(f"Files: {summary['files']} | With payload: {summary['with_payload']} | Errors: {summary['errors']} | "
+          f"Elapsed: {summary['elapsed_seconds']}s | Files/min: {summary['files_per_minute']}", file=sys.stderr)
+    return summary
@@ -0,0 +1,407 @@
+import asyncio
+import contextlib
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+"""
+LSB_Service.py
+
+Local asyncio stego service. Accepts encode/decode requests over HTTP/1.1, on a TCP port or a Unix socket, with the
+images in the request body, and runs them on a bounded pool of worker processes that import LSB_Image once. Nothing
+is written to disk, the images only ever exist as bytes (see LSB_Image.StegoCodec).
+
+  POST /encode?bits=1&format=png&name=Secret.png   Body: cover bytes followed by secret bytes
+       X-Cover-Length: <bytes of the cover at the start of the body>
+       X-Key: <key> (optional, kept out of the URL)
+       -> 200 with the stego image in format (png or bmp)
+  POST /decode?format=png                          Body: stego bytes, X-Key as above
+       -> 200 with the restored image, its original name in the (percent encoded) X-Secret-Name header
+  GET  /stats
+       -> 200 with JSON counters, queue depth, latency percentiles and throughput
+
+Errors are returned as JSON {"error": "..."}: 400 for anything wrong with the request or images, 404/405 for unknown
+routes, 413 for bodies over max_body and 503 when the queue is full. Backpressure: at most `workers` requests run at
+once and at most `queue_limit` more wait for a worker, any request beyond that is refused with 503 and a Retry-After
+header straight away instead of piling up in memory.
+
+  LSB_Main.py serve [--host 127.0.0.1] [--port 8765 | --unix /tmp/lsb.sock] [-w <workers>] [--queue-limit 8]
+
+ServiceClient is a small blocking client for both transports, i.e. ServiceClient(port=8765).encode(cover, secret).
+"""
+
+DEFAULT_PORT = 8765
+_MAX_BODY = 512 * 1024 * 1024
+_LATENCY_WINDOW = 1024                                    # Requests the latency percentiles are taken over
+_FORMATS = {'png': 'image/png', 'bmp': 'image/bmp'}      # Lossless only, anything else would destroy the LSBs
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+            500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+# Jobs (run in the worker processes)---------------------------------------------
+
+def encode_job(cover, secret, secret_name, output_format='png', bits=1, key=None):
+    """Encodes secret (bytes) into cover (bytes), returning the stego image bytes in output_format"""
+    from LSB_Image import StegoCodec
+
+    return StegoCodec(bits, key).encode(cover, secret, output_format=output_format, name=secret_name)
+
+
+def decode_job(stego, output_format='png', key=None):
+    """Extracts the hidden image from stego (bytes). Returns (image bytes in output_format, original name)"""
+    from LSB_Image import StegoCodec
+
+    restored_image = StegoCodec(key=key).decode(stego)
+    return restored_image.tobytes(output_format), restored_image.name
+
+
+def _warm_up():
+    """Worker initializer, so the first request a worker gets does not pay for importing numpy/PIL"""
+    import LSB_Image                                      # noqa: F401
+
+
+# Classes ----------------------------
+
+class ServiceError(ValueError):
+    def __init__(self, status, message):
+        """Error response of the service (or one to send), with its HTTP status"""
+        super().__init__(message)
+        self.status = status
+
+
+class ServiceStats:
+    def __init__(self):
+        self.started = time.time()
+        self.requests = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._latencies = {'encode': deque(maxlen=_LATENCY_WINDOW), 'decode': deque(maxlen=_LATENCY_WINDOW)}
+        self._finished = deque(maxlen=_LATENCY_WINDOW)     # Completion times, for the recent throughput
+
+    def record(self, operation, seconds, success):
+        if success:
+            self.completed += 1
+            self._latencies[operation].append(seconds)
+            self._finished.append(time.monotonic())
+        else:
+            self.failed += 1
+
+    def snapshot(self, running, queued, workers, queue_limit):
+        uptime = time.time() - self.started
+        recent = [finished for finished in self._finished if finished >= time.monotonic() - 60]
+        return {
+            'uptime_seconds': round(uptime, 3),
+            'workers': workers,
+            'queue_limit': queue_limit,
+            'running': running,
+            'queued': queued,
+            'requests': self.requests,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'requests_per_second': round(self.completed / uptime, 3) if uptime else 0.0,
+            'requests_per_second_last_minute': round(len(recent) / min(60.0, uptime), 3) if uptime else 0.0,
+            'latency_seconds': {operation: _percentiles(latencies)
+                                for operation, latencies in self._latencies.items()},
+        }
+
+
+class StegoService:
+    def __init__(self, workers=None, queue_limit=8, max_body=_MAX_BODY):
+        """workers is the process pool size (defaults to the CPU count), queue_limit how many requests may wait for
+        a worker before new ones are refused"""
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = queue_limit
+        self.max_body = max_body
+        self.stats = ServiceStats()
+        self._pending = 0                                 # Requests running or waiting for a worker
+        self._pool = None
+        self._server = None
+        self._unix_path = None
+
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT, unix_path=None):
+        """Starts the worker pool and listens on host:port, or on unix_path if given. Returns the asyncio server"""
+        self._pool = self._new_pool()
+        if unix_path:
+            self._unix_path = unix_path
+            self._server = await asyncio.start_unix_server(self._handle_connection, unix_path)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        if self._unix_path:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._unix_path)
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_warm_up)
+
+    def _replace_pool(self, broken):
+        """Swaps the broken pool for a fresh one. Every request that was running on it fails at once, only the first
+        one to get here replaces it (the event loop runs one at a time, so comparing the pools is enough)"""
+        if self._pool is not broken:
+            return
+        self._pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def _handle_connection(self, reader, writer):
+        """Serves requests on one connection until the client closes it (keep-alive) or asks for close"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ServiceError as error:
+                    await self._respond(writer, error.status, _error_body(error), close=True)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body, keep_alive = request
+                status, response_headers, payload = await self._dispatch(method, target, headers, body)
+                await self._respond(writer, status, payload, response_headers, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:                    # Server shutting down with the client still connected
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Returns (method, target, headers, body, keep alive), or None once the client has closed the connection"""
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise ServiceError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise ServiceError(400, "Invalid Content-Length")
+        if length > self.max_body:
+            raise ServiceError(413, f"Request body is over the {self.max_body} byte limit")
+        body = await reader.readexactly(length) if length else b''
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        return method, target, headers, body, keep_alive
+
+    async def _respond(self, writer, status, payload, headers=None, close=False):
+        headers = dict(headers or {'Content-Type': 'application/json'})
+        headers['Content-Length'] = str(len(payload))
+        headers['Connection'] = 'close' if close else 'keep-alive'
+        head = f"HTTP/1.1 {status} {_REASONS.get(status, 'Unknown')}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items()) + "\r\n"
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+    async def _dispatch(self, method, target, headers, body):
+        """Returns (status, headers, body) for one request"""
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        routes = {'/encode': ('POST', self._encode), '/decode': ('POST', self._decode), '/stats': ('GET', self._stats)}
+        if url.path not in routes:
+            return 404, None, _error_body(f"No route {url.path}")
+        if method != routes[url.path][0]:
+            return 405, {'Content-Type': 'application/json', 'Allow': routes[url.path][0]}, \
+                _error_body(f"{url.path} only accepts {routes[url.path][0]}")
+
+        try:
+            return await routes[url.path][1](query, headers, body)
+        except ServiceError as error:
+            headers = {'Content-Type': 'application/json'}
+            if error.status == 503:
+                headers['Retry-After'] = '1'
+            return error.status, headers, _error_body(error)
+
+    async def _stats(self, query, headers, body):
+        running = min(self._pending, self.workers)
+        stats = self.stats.snapshot(running, self._pending - running, self.workers, self.queue_limit)
+        return 200, None, json.dumps(stats).encode('utf-8')
+
+    async def _encode(self, query, headers, body):
+        output_format = _output_format(query)
+        try:
+            bits = int(query.get('bits', 1))
+            cover_length = int(headers['x-cover-length'])
+        except (KeyError, ValueError):
+            raise ServiceError(400, "X-Cover-Length header (and a numeric bits) is required")
+        if bits not in range(1, 5):
+            raise ServiceError(400, f"{bits} bits per channel is not supported, choose 1 to 4")
+        if not 0 < cover_length < len(body):
+            raise ServiceError(400, f"X-Cover-Length {cover_length} does not leave a secret in the body")
+
+        stego = await self._submit('encode', len(body), encode_job, body[:cover_length], body[cover_length:],
+                                   query.get('name', 'secret.png'), output_format, bits, headers.get('x-key'))
+        return 200, {'Content-Type': _FORMATS[output_format]}, stego
+
+    async def _decode(self, query, headers, body):
+        output_format = _output_format(query)
+        if not body:
+            raise ServiceError(400, "The stego image is missing from the body")
+
+        restored, name = await self._submit('decode', len(body), decode_job, body, output_format,
+                                            headers.get('x-key'))
+        return 200, {'Content-Type': _FORMATS[output_format], 'X-Secret-Name': quote(name)}, restored
+
+    async def _submit(self, operation, bytes_in, job, *args):
+        """Runs job on the pool, or refuses it straight away when workers + queue_limit requests are pending"""
+        self.stats.requests += 1
+        if self._pending >= self.workers + self.queue_limit:
+            self.stats.rejected += 1
+            raise ServiceError(503, f"Queue is full ({self._pending} requests pending), retry later")
+
+        self._pending += 1
+        self.stats.bytes_in += bytes_in
+        start = time.perf_counter()
+        success = False
+        pool = self._pool
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(pool, job, *args)
+            success = True
+        except BrokenProcessPool:
+            self._replace_pool(pool)                      # Requests after this one get a fresh pool
+            raise ServiceError(500, "Worker process died while running this request")
+        except (ValueError, OSError) as error:            # Bad images, too small covers, wrong keys...
+            raise ServiceError(400, f"{type(error).__name__}: {error}")
+        except Exception as error:
+            raise ServiceError(500, f"{type(error).__name__}: {error}")
+        finally:
+            self._pending -= 1
+            self.stats.record(operation, time.perf_counter() - start, success)
+
+        self.stats.bytes_out += len(result[0] if isinstance(result, tuple) else result)
+        return result
+
+
+class ServiceClient:
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, unix_path=None, timeout=300):
+        """Blocking client for a StegoService on host:port or unix_path. Keeps one connection open between
+        requests. Error responses are raised as ServiceError"""
+        if unix_path:
+            self._connection = _UnixConnection(unix_path, timeout)
+        else:
+            self._connection = http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def encode(self, cover, secret, secret_name='secret.png', output_format='png', bits=1, key=None):
+        """Returns the stego image bytes for cover and secret (bytes)"""
+        headers = {'X-Cover-Length': str(len(cover))}
+        if key is not None:
+            headers['X-Key'] = key
+        target = f"/encode?bits={bits}&format={output_format}&name={quote(secret_name)}"
+        return self._request('POST', target, cover + secret, headers)[0]
+
+    def decode(self, stego, output_format='png', key=None):
+        """Returns (restored image bytes, original name of the hidden image)"""
+        headers = {} if key is None else {'X-Key': key}
+        body, response_headers = self._request('POST', f"/decode?format={output_format}", stego, headers)
+        return body, unquote(response_headers.get('X-Secret-Name', ''))
+
+    def stats(self):
+        return json.loads(self._request('GET', '/stats')[0])
+
+    def _request(self, method, target, body=None, headers=None):
+        self._connection.request(method, target, body, headers or {})
+        response = self._connection.getresponse()
+        payload = response.read()
+        if response.status != 200:
+            try:
+                message = json.loads(payload)['error']
+            except (ValueError, KeyError):
+                message = payload.decode('utf-8', 'replace')
+            raise ServiceError(response.status, message)
+        return payload, response.headers
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, unix_path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self._unix_path = unix_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._unix_path)
+
+
+def _output_format(query):
+    output_format = query.get('format', 'png').lower()
+    if output_format not in _FORMATS:
+        raise ServiceError(400, f"Output format must be one of {', '.join(_FORMATS)}, got {output_format}")
+    return output_format
+
+
+def _error_body(error):
+    return json.dumps({'error': str(error)}).encode('utf-8')
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return {'count': 0}
+    ordered = sorted(latencies)
+    summary = {'count': len(ordered), 'mean': round(sum(ordered) / len(ordered), 4)}
+    for name, fraction in [('p50', 0.5), ('p95', 0.95), ('p99', 0.99)]:
+        summary[name] = round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 4)
+    summary['max'] = round(ordered[-1], 4)
+    return summary
+
+
+# Running---------------------------------------------
+
+def serve(host='127.0.0.1', port=DEFAULT_PORT, unix_path=None, workers=None, queue_limit=8):
+    """Entry point for the serve subcommand. Runs until interrupted (Ctrl+C or SIGTERM), then shuts the worker pool
+    down"""
+    async def run():
+        with contextlib.suppress(NotImplementedError):   # No signal handlers in asyncio on Windows
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        service = StegoService(workers, queue_limit)
+        server = await service.start(host, port, unix_path)
+        address = unix_path or f"http://{host}:{port}"
+        print(f"Serving on {address} | Workers: {service.workers} | Queue limit: {queue_limit}", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await service.close()
+
+    with contextlib.suppress(KeyboardInterrupt, asyncio.CancelledError):
+        asyncio.run(run())
@@ -0,0 +1,86 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+"""
+LSB_Startup.py
+
+Startup budget check for the scripted entry point. Scripted pipelines shell out to LSB_Main.py once per file, so a
+slow start (heavy imports, banners, sleeps) costs more than the embedding itself on small images. The test suite
+enforces the default budget (tests/test_startup.py, skipped when LSB_SKIP_STARTUP_BUDGET is set), other budgets can
+be checked by hand:
+
+  python LSB_Startup.py [--entry-ms 50] [--hot-path-ms 300] [--help-ms 500]
+
+It checks, each in a fresh interpreter:
+  * Importing LSB_Main stays within --entry-ms (measured with -X importtime) and does not pull in any of the
+    modules that only the interactive menu or the actual work needs
+  * Importing LSB_Main + LSB_Image (everything an encode/decode subcommand loads) stays within --hot-path-ms
+  * LSB_Main.py encode --help returns within --help-ms of wall clock time (no banner, menu or sleep on the way)
+Exits with 1 and lists every breach if the budget is exceeded.
+"""
+
+LAZY_MODULES = ['pyfiglet', 'termcolor', 'numpy', 'PIL', 'LSB_Image', 'LSB_Batch', 'concurrent.futures']
+
+_BIN = os.path.dirname(os.path.abspath(__file__))
+_IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def import_times(statement):
+    """Runs statement with -X importtime in a fresh interpreter. Returns {module: cumulative microseconds}"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], cwd=_BIN, capture_output=True,
+                            text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        if match:
+            times[match.group(4)] = int(match.group(2))
+    return times
+
+
+def check_startup(entry_ms=50.0, hot_path_ms=300.0, help_ms=500.0):
+    """Returns a list of budget breaches, empty when startup is within budget"""
+    breaches = []
+
+    entry = import_times("import LSB_Main")
+    entry_cost = entry.get('LSB_Main', 0) / 1000
+    if entry_cost > entry_ms:
+        breaches.append(f"Importing LSB_Main took {entry_cost:.1f}ms, budget is {entry_ms}ms")
+    eager = [module for module in LAZY_MODULES if module in entry]
+    if eager:
+        breaches.append(f"Importing LSB_Main eagerly imports {', '.join(eager)}")
+
+    hot_path = import_times("import LSB_Main, LSB_Image")
+    hot_path_cost = (hot_path.get('LSB_Main', 0) + hot_path.get('LSB_Image', 0)) / 1000
+    if hot_path_cost > hot_path_ms:
+        breaches.append(f"Importing the encode/decode hot path took {hot_path_cost:.1f}ms, budget is {hot_path_ms}ms")
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, 'LSB_Main.py', 'encode', '--help'], cwd=_BIN, capture_output=True, check=True)
+    help_cost = (time.perf_counter() - start) * 1000
+    if help_cost > help_ms:
+        breaches.append(f"LSB_Main.py encode --help took {help_cost:.1f}ms, budget is {help_ms}ms")
+
+    print(f"Entry import: {entry_cost:.1f}ms | Hot path import: {hot_path_cost:.1f}ms | "
+          f"encode --help: {help_cost:.1f}ms")
+    return breaches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LSB Steganography App - Startup Budget Check")
+    parser.add_argument('--entry-ms', type=float, default=50.0, help="Budget for importing LSB_Main")
+    parser.add_argument('--hot-path-ms', type=float, default=300.0, help="Budget for importing LSB_Main + LSB_Image")
+    parser.add_argument('--help-ms', type=float, default=500.0, help="Wall clock budget for LSB_Main.py encode --help")
+    args = parser.parse_args()
+
+    breaches = check_startup(args.entry_ms, args.hot_path_ms, args.help_ms)
+    for breach in breaches:
+        print(f"Budget exceeded: {breach}", file=sys.stderr)
+    quit(1 if breaches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+import struct
+import zlib
+
+import numpy as np
+
+from PIL import Image
+
+from LSB_Cipher import get_cipher
+from LSB_Codec import get_codec
+from LSB_Engine import channels_needed, check_segments, decrypt_array, embed_scattered, embed_window, extract, \
+    extract_scattered, pack_values, scattered_values
+from LSB_Header import FIXED_SIZE, StegoHeader, TrailerScanner, has_magic
+from LSB_Preflight import restored_size
+from LSB_Writer import open_writer, verify_output
+
+"""
+LSB_Stream.py
+
+Row-strip streaming mode for covers that are too large to decode in one go. The cover is read in horizontal strips
+of strip_height rows, converted to RGB one strip at a time, embedded (only the strips the payload covers are
+touched) and written straight out again, so peak memory is bounded by the strip size rather than the image size.
+Decoding stops reading the stego file after the last strip that holds payload bits.
+
+Strips are read without decoding the whole image for:
+  * Uncompressed images made of full-width raw tiles (BMP, uncompressed TIFF, PPM)
+  * Non-interlaced 8 bit PNGs (IDAT is inflated incrementally and every strip is unfiltered by PIL)
+Any other cover is decoded in full and then handed out in strips. Output is streamed as BMP or PNG through
+LSB_Writer, which compresses PNG strips in the background while the next strip is embedded.
+"""
+
+DEFAULT_STRIP_HEIGHT = 256
+
+_RAW_BITS = {'1': 1, 'L': 8, 'P': 8, 'LA': 16, 'I;16': 16, 'I;16B': 16, 'RGB': 24, 'BGR': 24, 'RGBX': 32,
+             'BGRX': 32, 'RGBA': 32, 'BGRA': 32, 'CMYK': 32, 'RGB;16B': 48}
+_PNG_MODES = ['L', 'LA', 'P', 'RGB', 'RGBA']
+
+
+# Classes ----------------------------
+
+class StripReader:
+    def __init__(self, path, strip_height=DEFAULT_STRIP_HEIGHT):
+        """Reads path as RGB strips of strip_height rows. Use as a context manager"""
+        if strip_height < 1:
+            raise ValueError(f"Strip height must be at least 1, got {strip_height}")
+        self.path = path
+        self.strip_height = strip_height
+        self.image = Image.open(path)
+        self.width, self.height = self.image.size
+        self._file = open(path, 'rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._file.close()
+        self.image.close()
+
+    def strips(self):
+        """Yields (top row, (rows, width, 3) uint8 array) from the top of the image down"""
+        if self._raw_tiles():
+            source = self._raw_strips()
+        elif self._png_rows():
+            source = self._png_strips()
+        else:
+            source = self._decoded_strips()
+        yield from source
+
+    # Raw tiles ----------------------------
+
+    def _raw_tiles(self):
+        tiles = []
+        for tile in self.image.tile:
+            args = (tile.args,) if isinstance(tile.args, str) else tuple(tile.args)
+            rawmode, stride, orientation = (args + (0, 1))[:3]
+            x0, y0, x1, y1 = tile.extents
+            if tile.codec_name != 'raw' or x0 != 0 or x1 != self.width or rawmode not in _RAW_BITS:
+                return []
+            stride = stride or (self.width * _RAW_BITS[rawmode] + 7) // 8
+            tiles.append((y0, y1, tile.offset, rawmode, stride, orientation))
+        return sorted(tiles)
+
+    def _raw_strips(self):
+        tiles = self._raw_tiles()
+        for top in range(0, self.height, self.strip_height):
+            bottom = min(top + self.strip_height, self.height)
+            pieces = [self._read_raw_rows(tile, max(top, tile[0]), min(bottom, tile[1]))
+                      for tile in tiles if tile[0] < bottom and tile[1] > top]
+            yield top, np.concatenate(pieces) if len(pieces) > 1 else pieces[0]
+
+    def _read_raw_rows(self, tile, top, bottom):
+        """Reads rows [top, bottom) out of a single raw tile. Bottom-up tiles (BMP) store the block reversed"""
+        y0, y1, offset, rawmode, stride, orientation = tile
+        first = (top - y0) if orientation > 0 else (y1 - bottom)
+        self._file.seek(offset + first * stride)
+        data = self._file.read((bottom - top) * stride)
+        piece = Image.frombuffer(self.image.mode, (self.width, bottom - top), data, 'raw', rawmode, stride,
+                                 orientation)
+        return self._to_rgb(piece)
+
+    # PNG ----------------------------
+
+    def _png_rows(self):
+        """Returns the filtered row length of a PNG that can be unfiltered strip by strip, otherwise 0"""
+        if self.image.format != 'PNG' or self.image.mode not in _PNG_MODES or self.image.tile[0].args != \
+                self.image.mode:
+            return 0
+
+        self._file.seek(8)
+        length, chunk = struct.unpack('>I4s', self._file.read(8))
+        width, height, depth, colour, _, _, interlace = struct.unpack('>IIBBBBB', self._file.read(13))
+        if chunk != b'IHDR' or depth != 8 or interlace:
+            return 0
+        channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[colour]
+        return width * channels + 1
+
+    def _png_strips(self):
+        """Inflates no more of the IDAT stream than the next strip needs, so however the PNG splits its IDAT chunks
+        at most one strip is ever held inflated"""
+        row_size = self._png_rows()
+        inflater = zlib.decompressobj()
+        previous = b'\x00' * row_size                     # Filter type None + zeroes acts as the row above row 0
+        pending = bytearray()
+        top = 0
+
+        for data in self._idat_chunks():
+            while True:
+                rows = min(self.strip_height, self.height - top)
+                pending += inflater.decompress(data, rows * row_size - len(pending))
+                data = inflater.unconsumed_tail
+                if len(pending) < rows * row_size:
+                    break                                 # This chunk is used up
+                strip, previous = self._unfilter(previous, pending, rows)
+                pending = bytearray()
+                yield top, strip
+                top += rows
+                if top >= self.height:
+                    return
+
+    def _idat_chunks(self):
+        self._file.seek(8)
+        while True:
+            length, chunk = struct.unpack('>I4s', self._file.read(8))
+            if chunk == b'IDAT':
+                yield self._file.read(length)
+                self._file.seek(4, 1)
+            elif chunk == b'IEND':
+                return
+            else:
+                self._file.seek(length + 4, 1)
+
+    def _unfilter(self, previous, block, rows):
+        """Lets PIL's zip decoder unfilter a strip by putting the (unfiltered) row above it in front as row 0"""
+        data = zlib.compress(previous + block, 0)
+        piece = Image.frombytes(self.image.mode, (self.width, rows + 1), data, 'zip', self.image.mode)
+        last_row = b'\x00' + piece.crop((0, rows, self.width, rows + 1)).tobytes()
+        return self._to_rgb(piece.crop((0, 1, self.width, rows + 1))), last_row
+
+    # Fallback ----------------------------
+
+    def _decoded_strips(self):
+        rgb = np.asarray(self.image.convert('RGB'), dtype=np.uint8)
+        for top in range(0, self.height, self.strip_height):
+            yield top, rgb[top:top + self.strip_height]
+
+    def _to_rgb(self, piece):
+        if piece.mode == 'P':
+            piece.putpalette(self.image.getpalette())
+        if piece.mode != 'RGB':
+            piece = piece.convert('RGB')
+        return np.asarray(piece, dtype=np.uint8)
+
+
+# Encoding---------------------------------------------
+
+def stream_embed(coverimage, outfile, segments, strip_height=DEFAULT_STRIP_HEIGHT, workers=1, options=None):
+    """Embeds encrypted payloads strip by strip. segments is a list of LSB_Engine segments. Strips past the end of
+    the last payload are copied through unchanged. Strips are decoded in order, workers only splits the embed of
+    each strip. options (LSB_Writer.OutputOptions) picks how the output is encoded and whether it is verified"""
+    with StripReader(coverimage, strip_height) as reader:
+        end = check_segments(segments, reader.width * reader.height * 3)
+
+        with open_writer(outfile, reader.width, reader.height, options) as writer:
+            for top, strip in reader.strips():
+                start = top * reader.width * 3
+                if start < end:
+                    strip = np.array(strip, dtype=np.uint8)
+                    for payload, offset, bits, scatter in segments:
+                        if scatter:
+                            embed_scattered(strip.reshape(-1), payload, start, scatter, bits, workers)
+                        else:
+                            embed_window(strip.reshape(-1), payload, start, offset, bits, workers=workers)
+                writer.write(top, strip)
+    if options is not None and options.verify:
+        verify_output(outfile, writer.crc)
+
+
+# Decoding---------------------------------------------
+
+def stream_extract(stegofile, strip_height=DEFAULT_STRIP_HEIGHT, key=None, workers=1):
+    """Reads the hidden data strip by strip and stops after the last strip the payload covers (scattered payloads
+    read every strip). key is needed for keyed payloads. Compressed payloads are decompressed chunk by chunk as they
+    are read. Returns (StegoHeader, payload bytes, None) or (None, image bytes, trailer bytes) for the legacy
+    format"""
+    with StripReader(stegofile, strip_height) as reader:
+        stream = _ChannelStream(reader)
+        fixed = decrypt_array(extract(stream.read(FIXED_SIZE * 8), FIXED_SIZE)).tobytes()
+
+        if not has_magic(fixed):
+            scanner = TrailerScanner()
+            chunk = fixed
+            while not scanner.feed(chunk):
+                channels = stream.read(stream.chunk_size, partial=True)
+                if channels.size < 8:
+                    raise ValueError("No hidden metadata found in stego image")
+                chunk = decrypt_array(extract(channels, channels.size // 8)).tobytes()
+            return (None,) + scanner.split()
+
+        header, name_len = StegoHeader.unpack_fixed(fixed)
+        header.name = decrypt_array(extract(stream.read(name_len * 8), name_len)).tobytes().decode('utf-8')
+        cipher = get_cipher(header.cipher, key)
+        scatter = cipher.scatter(header.size * 8, reader.width * reader.height * 3)
+        decompressor = get_codec(header.codec).decompressor(restored_size(header))
+
+        if scatter:
+            values = scattered_values(header.length, header.bits, scatter)
+            for start, channels in stream.windows():
+                extract_scattered(channels, values, start, scatter, header.bits, workers)
+            payload = cipher.decrypt(pack_values(values, header.length, header.bits, workers)).tobytes()
+            return header, decompressor.decompress(payload) + decompressor.flush(), None
+
+        payload = bytearray()
+        read = 0
+        chunk_bytes = stream.chunk_size * header.bits // 8       # Whole chunks always end on a byte boundary
+        while read < header.length:
+            nbytes = min(chunk_bytes, header.length - read)
+            channels = stream.read(channels_needed(nbytes, header.bits))
+            payload += decompressor.decompress(cipher.decrypt(extract(channels, nbytes, 0, header.bits, workers),
+                                                              read))
+            read += nbytes
+        payload += decompressor.flush()
+        return header, bytes(payload), None
+
+
+def stream_header(stegofile, strip_height=16, trailer_bytes=0):
+    """Reads only the strips the stego header lies in, without touching the payload. Images without a header are
+    searched for a legacy trailer within their first trailer_bytes hidden bytes. Returns (StegoHeader, None),
+    (None, trailer bytes) for a legacy image whose trailer was found, or (None, None)"""
+    with StripReader(stegofile, strip_height) as reader:
+        stream = _ChannelStream(reader)
+        channels = stream.read(FIXED_SIZE * 8, partial=True)
+        if channels.size < FIXED_SIZE * 8:
+            return None, None
+        fixed = decrypt_array(extract(channels, FIXED_SIZE)).tobytes()
+
+        if has_magic(fixed):
+            header, name_len = StegoHeader.unpack_fixed(fixed)
+            header.name = decrypt_array(extract(stream.read(name_len * 8), name_len)).tobytes().decode('utf-8')
+            if header.size * 8 + channels_needed(header.length, header.bits) > reader.width * reader.height * 3:
+                raise ValueError(f"Header describes {header.length} payload bytes, more than the image can hold")
+            return header, None
+
+        scanner = TrailerScanner()
+        chunk = fixed
+        while not scanner.feed(chunk):
+            remaining = trailer_bytes - len(scanner.data)
+            channels = stream.read(min(stream.chunk_size, remaining * 8), partial=True) if remaining > 0 else None
+            if channels is None or channels.size < 8:
+                return None, None
+            chunk = decrypt_array(extract(channels, channels.size // 8)).tobytes()
+        return None, scanner.split()[1]
+
+
+class _ChannelStream:
+    def __init__(self, reader):
+        """Hands out the channels of a StripReader in arbitrary sized pieces, pulling strips only as needed"""
+        self._strips = reader.strips()
+        self._pending = np.empty(0, dtype=np.uint8)
+        self.chunk_size = max(8, reader.width * 3 * reader.strip_height // 8 * 8)
+        self.position = 0                                 # Channel offset of the next channel handed out
+
+    def read(self, count, partial=False):
+        """Returns the next count channels. With partial=True fewer are returned at the end of the image"""
+        pieces = []
+        have = 0
+        while have < count:
+            if not self._pending.size:
+                strip = next(self._strips, None)
+                if strip is None:
+                    if partial:
+                        break
+                    raise ValueError(f"Stego image ended before the {count} channels needed could be read")
+                self._pending = strip[1].reshape(-1)
+            piece, self._pending = self._pending[:count - have], self._pending[count - have:]
+            pieces.append(piece)
+            have += piece.size
+        self.position += have
+        return np.concatenate(pieces) if pieces else self._pending[:0]
+
+    def windows(self):
+        """Yields (channel offset, channels) for the rest of the image, the leftover of the current strip first"""
+        if self._pending.size:
+            yield self.position, self._pending
+        for top, strip in self._strips:
+            yield top * strip.shape[1] * 3, strip.reshape(-1)
+        self._pending = self._pending[:0]
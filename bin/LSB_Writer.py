@@ -0,0 +1,288 @@
+import os
+import struct
+import zlib
+
+from collections import deque
+
+import numpy as np
+
+"""
+LSB_Writer.py
+
+Row-incremental output writers for stego images. Rows are handed over top down as soon as they are final (a strip at
+a time when streaming, see LSB_Stream) and encoded right away, so a strip can be embedded while the ones before it
+are still being compressed:
+
+  BMPWriter  Uncompressed bottom-up 24 bit BI_RGB BMP. Every strip is written straight to its final position, no
+             encoding at all, the fastest output (and the largest)
+  PNGWriter  8 bit RGB PNG. Each strip is filtered (png_filter) and then deflated at png_level on a pool of threads.
+             Strips are deflated as independent pieces primed with the previous 32 KiB and joined into a single
+             zlib stream, so the file is the same whatever the number of threads
+
+OutputOptions picks the trade-off per job, i.e. OutputOptions(png_level=1) for speed or
+OutputOptions(png_level=9, png_filter='adaptive') for size. PNG filters:
+
+  none      Rows as they are (0)
+  sub       Difference to the pixel on the left (1)
+  up        Difference to the pixel above (2)
+  average   Difference to the mean of left and above (3)
+  paeth     Difference to the Paeth predictor (4)
+  adaptive  Per row, whichever of the five gives the smallest sum of absolute differences (slowest, usually smallest)
+
+Only lossless formats keep the LSBs, check_lossless refuses anything else before any work is done. With
+verify=True the written file is read back and its pixels compared (by CRC-32) to the ones handed to the writer.
+"""
+
+LOSSLESS_EXTENSIONS = ['.png', '.bmp', '.tif', '.tiff', '.ppm', '.pnm']
+PNG_FILTERS = {'none': 0, 'sub': 1, 'up': 2, 'average': 3, 'paeth': 4, 'adaptive': None}
+DEFAULT_LEVEL = 6
+PIECE_ROWS = 256                                          # Rows per piece when writing a whole image buffer
+
+_WINDOW = 1 << 15
+
+
+def check_lossless(outfile):
+    """Raises ValueError if outfile's extension is a format that would not keep the LSBs"""
+    name = outfile if isinstance(outfile, (str, os.PathLike)) else getattr(outfile, 'name', '')
+    extension = os.path.splitext(str(name))[1].lower()
+    if extension and extension not in LOSSLESS_EXTENSIONS:
+        raise ValueError(f"{extension} is not a lossless format, the hidden data would not survive it. Use one of "
+                         f"{', '.join(LOSSLESS_EXTENSIONS)}")
+
+
+def open_writer(output, width, height, options=None):
+    """Returns the BMPWriter or PNGWriter for output's extension. output is a path or a seekable binary file object
+    with a name"""
+    options = options or OutputOptions()
+    name = output if isinstance(output, (str, os.PathLike)) else getattr(output, 'name', '')
+    extension = os.path.splitext(str(name))[1].lower()
+    if extension == '.bmp':
+        return BMPWriter(output, width, height, options.verify)
+    if extension == '.png':
+        return PNGWriter(output, width, height, options.png_level, options.png_filter, options.workers,
+                         options.verify)
+    raise ValueError(f"Rows can only be written to .bmp or .png output files, got {name}")
+
+
+def verify_output(output, expected_crc):
+    """Reads output back and raises ValueError unless its RGB pixels have the CRC-32 of the ones written"""
+    from LSB_Stream import StripReader                    # LSB_Stream writes through this module
+
+    crc = 0
+    if isinstance(output, (str, os.PathLike)):
+        with StripReader(output) as reader:
+            for _, strip in reader.strips():
+                crc = zlib.crc32(np.ascontiguousarray(strip), crc)
+    else:
+        from PIL import Image
+        position = output.tell()
+        output.seek(0)
+        with Image.open(output) as image:
+            crc = zlib.crc32(np.asarray(image.convert('RGB'), dtype=np.uint8))
+        output.seek(position)
+    if crc != expected_crc:
+        raise ValueError("The written output does not hold the embedded pixels, the hidden data did not survive")
+
+
+# Classes ----------------------------
+
+class OutputOptions:
+    def __init__(self, png_level=DEFAULT_LEVEL, png_filter='none', workers=1, verify=False):
+        """How stego images are written. png_level (0-9) and png_filter (see PNG_FILTERS) only apply to PNG output,
+        workers is the number of threads PNG pieces are deflated on"""
+        if png_level not in range(0, 10):
+            raise ValueError(f"PNG compression level must be between 0 and 9, got {png_level}")
+        if png_filter not in PNG_FILTERS:
+            raise ValueError(f"Unknown PNG filter {png_filter!r}, choose one of {', '.join(PNG_FILTERS)}")
+        self.png_level = png_level
+        self.png_filter = png_filter
+        self.workers = workers
+        self.verify = verify
+
+
+class _RowWriter:
+    def __init__(self, output, width, height, checksum=False):
+        """Common part of the writers: output handling and the CRC-32 of the RGB rows written (with checksum)"""
+        self.width = width
+        self.height = height
+        self.crc = 0 if checksum else None
+        self._owned = not hasattr(output, 'write')
+        self._file = open(output, 'wb') if self._owned else output
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, top, strip):
+        """Writes the (rows, width, 3) RGB strip starting at row top. Strips arrive top down"""
+        if self.crc is not None:
+            self.crc = zlib.crc32(np.ascontiguousarray(strip), self.crc)
+        self._write(top, strip)
+
+    def write_image(self, buffer):
+        """Writes a whole (height, width, 3) buffer, PIECE_ROWS rows at a time"""
+        for top in range(0, self.height, PIECE_ROWS):
+            self.write(top, buffer[top:top + PIECE_ROWS])
+
+    def close(self):
+        if self._owned:
+            self._file.close()
+
+    def abort(self):
+        """Releases the output without finishing it, after a failure"""
+        if self._owned:
+            self._file.close()
+
+
+class BMPWriter(_RowWriter):
+    def __init__(self, output, width, height, checksum=False):
+        """Writes a bottom-up 24 bit BI_RGB BMP. Strips arrive top down, so each is written to its final position"""
+        super().__init__(output, width, height, checksum)
+        self.stride = (width * 3 + 3) & ~3
+
+        image_size = self.stride * height
+        self._start = self._file.tell()
+        self._file.write(struct.pack('<2sIHHI', b'BM', 54 + image_size, 0, 0, 54))
+        self._file.write(struct.pack('<IiiHHIIiiII', 40, width, height, 1, 24, 0, image_size, 0, 0, 0, 0))
+        self._file.truncate(self._start + 54 + image_size)
+
+    def _write(self, top, strip):
+        rows = strip.shape[0]
+        padded = np.zeros((rows, self.stride), dtype=np.uint8)
+        padded[:, :self.width * 3] = strip[::-1, :, ::-1].reshape(rows, -1)  # Bottom-up rows, BGR channel order
+        self._file.seek(self._start + 54 + (self.height - top - rows) * self.stride)
+        self._file.write(padded.tobytes())
+
+    def close(self):
+        self._file.seek(self._start + 54 + self.stride * self.height)
+        super().close()
+
+
+class PNGWriter(_RowWriter):
+    def __init__(self, output, width, height, level=DEFAULT_LEVEL, png_filter='none', workers=1, checksum=False):
+        """Writes an 8 bit RGB PNG, filtering and deflating strips as they arrive. Deflating runs on `workers`
+        background threads, so the caller can prepare the next strip meanwhile"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        super().__init__(output, width, height, checksum)
+        self.level = level
+        self.filter_type = PNG_FILTERS[png_filter]
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._pieces = deque()
+        self._max_pending = workers * 2
+        self._rows = 0
+        self._above = np.zeros(width * 3, dtype=np.uint8)  # Row above the next strip, zeros above the image
+        self._dictionary = b''                            # Last 32 KiB of filtered data, across pieces
+        self._adler = 1
+
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        self._write_chunk(b'IDAT', _zlib_header(level))
+
+    def _write(self, top, strip):
+        rows = np.ascontiguousarray(strip, dtype=np.uint8).reshape(strip.shape[0], -1)
+        filtered = _filter_rows(rows, self._above, self.filter_type)
+        self._above = rows[-1].copy()
+        self._rows += rows.shape[0]
+
+        self._adler = zlib.adler32(filtered, self._adler)
+        self._pieces.append(self._executor.submit(_deflate_piece, filtered, self._dictionary, self.level,
+                                                  self._rows >= self.height))
+        if len(filtered) >= _WINDOW:
+            self._dictionary = filtered[-_WINDOW:]
+        else:                                             # A new object, the pieces in flight keep theirs
+            self._dictionary = (self._dictionary + filtered)[-_WINDOW:]
+        while len(self._pieces) > self._max_pending or (self._pieces and self._pieces[0].done()):
+            self._write_piece()
+
+    def close(self):
+        try:
+            while self._pieces:
+                self._write_piece()
+            if self._rows < self.height:
+                raise ValueError(f"Only {self._rows} of the {self.height} rows were written")
+            self._write_chunk(b'IDAT', struct.pack('>I', self._adler))
+            self._write_chunk(b'IEND', b'')
+        finally:
+            self._executor.shutdown()
+            super().close()
+
+    def abort(self):
+        for piece in self._pieces:
+            piece.cancel()
+        self._executor.shutdown()
+        super().abort()
+
+    def _write_piece(self):
+        piece = self._pieces.popleft().result()
+        if piece:
+            self._write_chunk(b'IDAT', piece)
+
+    def _write_chunk(self, chunk, data):
+        self._file.write(struct.pack('>I', len(data)) + chunk + data)
+        self._file.write(struct.pack('>I', zlib.crc32(chunk + data)))
+
+
+# PNG Encoding---------------------------------------------
+
+def _zlib_header(level):
+    """CMF/FLG bytes of a deflate stream with a 32 KiB window, FLEVEL set the way zlib itself sets it"""
+    return bytes([0x78, 0x01 if level < 2 else 0x5e if level < 6 else 0x9c if level == 6 else 0xda])
+
+
+def _deflate_piece(data, dictionary, level, final):
+    """Raw deflate of one piece. Pieces end on a byte boundary (sync flush) so they can be concatenated, only the
+    last one closes the stream"""
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _filter_rows(rows, above, filter_type):
+    """PNG-filters the (rows, width * 3) array. Every filter only looks at unfiltered bytes, so all rows are done at
+    once. Returns the filter type byte + filtered bytes of every row"""
+    count, stride = rows.shape
+    candidates = {0: rows}
+    if filter_type != 0:
+        up = np.vstack((above[None], rows[:-1]))
+        left = np.zeros_like(rows)
+        left[:, 3:] = rows[:, :-3]
+        up_left = np.zeros_like(rows)
+        up_left[:, 3:] = up[:, :-3]
+        for candidate in ([1, 2, 3, 4] if filter_type is None else [filter_type]):
+            candidates[candidate] = rows - _predict(candidate, left, up, up_left)
+
+    filtered = np.empty((count, stride + 1), dtype=np.uint8)
+    if filter_type is None:
+        scores = np.stack([np.abs(candidates[candidate].view(np.int8).astype(np.int32)).sum(axis=1)
+                           for candidate in range(5)])
+        choice = scores.argmin(axis=0)
+        filtered[:, 0] = choice
+        filtered[:, 1:] = np.stack([candidates[candidate] for candidate in range(5)])[choice, np.arange(count)]
+    else:
+        filtered[:, 0] = filter_type
+        filtered[:, 1:] = candidates[filter_type]
+    return filtered.tobytes()
+
+
+def _predict(filter_type, left, up, up_left):
+    if filter_type == 1:
+        return left
+    if filter_type == 2:
+        return up
+    if filter_type == 3:
+        return ((left.astype(np.uint16) + up) >> 1).astype(np.uint8)
+
+    left, up, up_left = (array.astype(np.int16) for array in (left, up, up_left))
+    distance_left = np.abs(up - up_left)                  # |p - left| with p = left + up - up_left
+    distance_up = np.abs(left - up_left)
+    distance_up_left = np.abs(left + up - 2 * up_left)
+    return np.where((distance_left <= distance_up) & (distance_left <= distance_up_left), left,
+                    np.where(distance_up <= distance_up_left, up, up_left)).astype(np.uint8)
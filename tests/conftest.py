@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The LSB_* modules import each other by plain name from bin/, as they do when run from there
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
@@ -0,0 +1,38 @@
+import os
+
+import LSB_Batch
+
+
+def _crash_or_succeed(job):
+    """Stand-in for LSB_Batch._run_job: the job marked crash kills its worker process"""
+    if job.get('crash'):
+        os._exit(1)
+    return LSB_Batch._result(job, True, 0.0)
+
+
+def test_crashing_job_does_not_fail_the_jobs_sharing_its_pool(monkeypatch):
+    monkeypatch.setattr(LSB_Batch, '_run_job', _crash_or_succeed)
+    jobs = [{'line': line, 'action': 'encode', 'output': f"out{line}.png"} for line in range(1, 9)]
+    jobs.insert(3, {'line': 99, 'action': 'encode', 'output': 'crash.png', 'crash': True})
+
+    summary = LSB_Batch.run_batch(jobs, workers=4, report=lambda result: None)
+
+    assert summary['jobs'] == 9
+    assert summary['succeeded'] == 8
+    assert summary['failures'] == [{'line': 99, 'error': "Worker process died while running this job"}]
+
+
+def test_malformed_manifest_lines_fail_only_their_own_job(tmp_path):
+    manifest = tmp_path / 'jobs.jsonl'
+    manifest.write_text('[1, 2]\n'
+                        '{"action": "encode", "cover": 5, "secret": "s.bmp", "output": "o.png"}\n'
+                        '{"action": "decode", "stegofile": "missing.png", "output": "r.bmp"}\n')
+
+    jobs = LSB_Batch.load_manifest(str(manifest))
+    summary = LSB_Batch.run_batch(jobs, workers=2, report=lambda result: None)
+
+    assert summary['jobs'] == 3
+    errors = {failure['line']: failure['error'] for failure in summary['failures']}
+    assert errors[1] == "ValueError: Expected a JSON object, got list"
+    assert errors[2] == "ValueError: cover must be a path string, got int"
+    assert errors[3].startswith('FileNotFoundError')
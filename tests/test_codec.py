@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+import LSB_Image
+from LSB_Codec import get_codec
+from LSB_Image import StegoCodec
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzma'])
+def test_decompressor_stops_past_max_size(compression):
+    codec = get_codec(compression)
+    data = codec.compress(bytes(1 << 20))
+
+    assert len(codec.decompressor(1 << 20).decompress(data)) == 1 << 20
+    with pytest.raises(ValueError, match='restores to more than'):
+        codec.decompressor(1000).decompress(data)
+
+
+@pytest.mark.parametrize('strip_height', [None, 16])
+def test_payload_inflating_past_its_header_size_is_rejected(monkeypatch, tmp_path, strip_height):
+    # A 2x2 RGB header over 4 MB of zeros, which compress to a few KB
+    monkeypatch.setattr(LSB_Image, '_load_secret',
+                        lambda secret, payload: ('RGB', 2, 2, np.zeros(1 << 22, dtype=np.uint8)))
+    cover = np.random.default_rng(0).integers(0, 256, (256, 256, 3), dtype=np.uint8)
+    stego = str(tmp_path / 'bomb.png')
+    StegoCodec(compression='zlib').encode(cover, 'secret.png', output=stego)
+
+    with pytest.raises(ValueError, match='restores to more than the 12 bytes'):
+        StegoCodec(strip_height=strip_height).decode(stego)
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from LSB_Engine import channels_needed, embed, extract
+
+
+@pytest.mark.parametrize('bits', [1, 2, 3, 4])
+@pytest.mark.parametrize('workers', [1, 3])
+def test_embed_extract_round_trip(bits, workers):
+    rng = np.random.default_rng(bits)
+    channels = rng.integers(0, 256, 500000, dtype=np.uint8)
+    original = channels.copy()
+    payload = rng.integers(0, 256, 50001, dtype=np.uint8)
+
+    end = embed(channels, payload, offset=17, bits=bits, workers=workers)
+
+    assert end == 17 + channels_needed(payload.size, bits)
+    assert np.array_equal(extract(channels, payload.size, 17, bits, workers), payload)
+    keep = 0xFF ^ ((1 << bits) - 1)
+    assert np.array_equal(channels & keep, original & keep)
+    assert np.array_equal(channels[:17], original[:17])
+    assert np.array_equal(channels[end:], original[end:])
+
+
+def test_embed_rejects_a_payload_past_the_cover():
+    with pytest.raises(ValueError):
+        embed(np.zeros(100, dtype=np.uint8), np.zeros(13, dtype=np.uint8))
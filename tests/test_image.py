@@ -0,0 +1,149 @@
+import io
+import os
+
+import numpy as np
+import pytest
+
+from PIL import Image
+
+from LSB_BMP import is_fast_bmp
+from LSB_Image import StegoCodec, encoder, reference_encoder
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _png_bytes(array):
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_nameless_file_payload_round_trips_byte_for_byte():
+    rng = np.random.default_rng(0)
+    cover = rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)
+    secret = _png_bytes(rng.integers(0, 256, (16, 16, 3), dtype=np.uint8))
+    codec = StegoCodec(payload='file')
+
+    restored = codec.decode(codec.encode(cover, secret))
+
+    assert restored.name == ''
+    assert restored.tobytes() == secret
+    assert restored.tobytes('bmp') == secret
+    output = io.BytesIO()
+    restored.write_image(output)
+    assert output.getvalue() == secret
+
+
+def _cover(height=160, width=120, seed=1):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def _secret(tmp_path, seed=2, name='secret.png'):
+    pixels = np.random.default_rng(seed).integers(0, 256, (12, 10, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(tmp_path / name)
+    return str(tmp_path / name), pixels
+
+
+def test_legacy_encoder_matches_the_reference_encoder(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)                           # The legacy trailer records the secret's path as given
+    Image.fromarray(_cover(40, 30)).save('cover.png')
+    _, pixels = _secret(tmp_path, name='s.png')
+
+    reference_encoder('cover.png', 's.png', 'reference.png')
+    encoder('cover.png', 's.png', 'legacy.png', legacy=True)
+
+    assert np.array_equal(np.asarray(Image.open('legacy.png')), np.asarray(Image.open('reference.png')))
+    assert np.array_equal(StegoCodec().decode('legacy.png').array(), pixels)
+
+
+def test_shipped_legacy_stego_file_still_decodes():
+    restored = StegoCodec().decode(os.path.join(_ROOT, 'Output Files', 'Dog.bmp'))
+
+    with Image.open(os.path.join(_ROOT, 'Restored Hidden', 'Restored_Dog.bmp')) as expected:
+        assert np.array_equal(restored.array(), np.asarray(expected.convert('RGB')))
+
+
+@pytest.mark.parametrize('bits', [1, 2, 4])
+@pytest.mark.parametrize('key', [None, 'key'])
+def test_round_trip(tmp_path, bits, key):
+    secret, pixels = _secret(tmp_path)
+    codec = StegoCodec(bits=bits, key=key)
+
+    restored = codec.decode(codec.encode(_cover(), secret))
+
+    assert restored.name == 'secret.png'
+    assert np.array_equal(restored.array(), pixels)
+
+
+def test_keyed_payload_is_scattered_and_needs_the_key(tmp_path):
+    secret, pixels = _secret(tmp_path)
+    cover = _cover()
+
+    plain = StegoCodec().encode(cover, secret, output_format='array')
+    keyed = StegoCodec(key='key').encode(cover, secret, output_format='array')
+
+    changed = np.flatnonzero((keyed != cover).reshape(-1))
+    assert changed.max() > np.flatnonzero((plain != cover).reshape(-1)).max()
+    assert np.array_equal(StegoCodec(key='key').decode(keyed).array(), pixels)
+    assert not np.array_equal(StegoCodec(key='wrong').decode(keyed).array(), pixels)
+    with pytest.raises(ValueError, match='a key is needed'):
+        StegoCodec().decode(keyed)
+
+
+@pytest.mark.parametrize('key', [None, 'key'])
+@pytest.mark.parametrize('extension', ['.png', '.bmp'])
+def test_strip_round_trip_matches_whole_image_encode(tmp_path, key, extension):
+    secret, pixels = _secret(tmp_path)
+    cover = str(tmp_path / f"cover{extension}")
+    Image.fromarray(_cover()).save(cover)
+    whole, streamed = str(tmp_path / f"whole{extension}"), str(tmp_path / f"streamed{extension}")
+
+    StegoCodec(key=key).encode(cover, secret, output=whole)
+    StegoCodec(key=key, strip_height=7).encode(cover, secret, output=streamed)
+
+    assert np.array_equal(np.asarray(Image.open(streamed)), np.asarray(Image.open(whole)))
+    assert np.array_equal(StegoCodec(key=key, strip_height=5).decode(streamed).array(), pixels)
+
+
+@pytest.mark.parametrize('bits', [1, 3])
+def test_bmp_fast_path_matches_pil_encode(tmp_path, bits):
+    secret, pixels = _secret(tmp_path)
+    cover = str(tmp_path / 'cover.bmp')
+    Image.fromarray(_cover(161, 123)).save(cover)     # Odd width, so BMP rows are padded
+    codec = StegoCodec(bits=bits)
+    assert is_fast_bmp(cover)
+
+    codec.encode(cover, secret, output=str(tmp_path / 'stego.bmp'))
+    expected = codec.encode(cover, secret, output_format='array')
+
+    assert np.array_equal(np.asarray(Image.open(tmp_path / 'stego.bmp')), expected)
+    assert np.array_equal(codec.decode(str(tmp_path / 'stego.bmp')).array(), pixels)
+
+
+@pytest.mark.parametrize('compression', ['zlib', 'lzma'])
+@pytest.mark.parametrize('key', [None, 'key'])
+def test_compressed_round_trip(tmp_path, compression, key):
+    pixels = np.zeros((60, 80, 3), dtype=np.uint8)
+    pixels[10:30, 20:50] = (200, 30, 90)                # Flat image, compresses many times over
+    Image.fromarray(pixels).save(tmp_path / 'flat.png')
+    cover = _cover(40, 40)
+    codec = StegoCodec(key=key, compression=compression)
+
+    stego = codec.encode(cover, str(tmp_path / 'flat.png'), output_format='array')
+
+    assert np.array_equal(codec.decode(stego).array(), pixels)
+    with pytest.raises(ValueError):
+        StegoCodec(key=key).encode(cover, str(tmp_path / 'flat.png'))   # Too big for the cover uncompressed
+
+
+def test_bmp_fast_path_can_write_over_its_cover(tmp_path):
+    secret, pixels = _secret(tmp_path)
+    cover = str(tmp_path / 'cover.bmp')
+    Image.fromarray(_cover()).save(cover)
+    expected = StegoCodec().encode(cover, secret, output_format='array')
+
+    StegoCodec().encode(cover, secret, output=cover)
+
+    assert np.array_equal(np.asarray(Image.open(cover)), expected)
+    assert np.array_equal(StegoCodec().decode(cover).array(), pixels)
+    assert sorted(os.listdir(tmp_path)) == ['cover.bmp', 'secret.png']
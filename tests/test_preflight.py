@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from PIL import Image
+
+from LSB_Image import StegoCodec
+from LSB_Preflight import check_capacity, required_channels
+
+
+def _save(path, pixels):
+    Image.fromarray(pixels).save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize('bits', [1, 3])
+def test_keyed_capacity_matches_what_the_encoder_needs(tmp_path, bits):
+    rng = np.random.default_rng(bits)
+    secret = _save(tmp_path / 's.png', rng.integers(0, 256, (9, 7, 3), dtype=np.uint8))
+    needed = required_channels(secret, bits, keyed=True)
+    assert needed > required_channels(secret, bits)
+    codec = StegoCodec(bits=bits, key='key')
+
+    exact = _save(tmp_path / 'exact.png', rng.integers(0, 256, (1, needed // 3, 3), dtype=np.uint8))
+    assert check_capacity(exact, secret, bits, keyed=True).fits
+    stego = codec.encode(exact, secret)
+    assert np.array_equal(codec.decode(stego).array(), np.asarray(Image.open(secret)))
+
+    short = _save(tmp_path / 'short.png', rng.integers(0, 256, (1, needed // 3 - 1, 3), dtype=np.uint8))
+    assert not check_capacity(short, secret, bits, keyed=True).fits
+    with pytest.raises(ValueError):
+        codec.encode(short, secret)
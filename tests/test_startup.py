@@ -0,0 +1,11 @@
+import os
+
+import pytest
+
+from LSB_Startup import check_startup
+
+
+@pytest.mark.skipif(bool(os.environ.get('LSB_SKIP_STARTUP_BUDGET')),
+                    reason="Startup budget disabled with LSB_SKIP_STARTUP_BUDGET, i.e. on a slow or loaded machine")
+def test_startup_stays_within_budget():
+    assert check_startup() == []
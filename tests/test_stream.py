@@ -0,0 +1,51 @@
+import struct
+import tracemalloc
+import zlib
+
+import numpy as np
+import pytest
+
+from PIL import Image
+
+from LSB_Stream import StripReader
+
+
+def _single_idat_png(path, pixels):
+    """Writes pixels as a PNG whose image data is one IDAT chunk, as many encoders other than PIL do"""
+    height, width = pixels.shape[:2]
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, -1)], axis=1)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    with open(path, 'wb') as png:
+        png.write(b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+                  chunk(b'IDAT', zlib.compress(rows.tobytes(), 9)) + chunk(b'IEND', b''))
+    return str(path)
+
+
+@pytest.mark.parametrize('strip_height', [1, 7, 64])
+def test_png_strips_match_the_decoded_image(tmp_path, strip_height):
+    pixels = np.random.default_rng(strip_height).integers(0, 256, (50, 33, 3), dtype=np.uint8)
+    path = str(tmp_path / 'cover.png')
+    Image.fromarray(pixels).save(path)
+
+    for cover in (path, _single_idat_png(tmp_path / 'single.png', pixels)):
+        with StripReader(cover, strip_height) as reader:
+            strips = list(reader.strips())
+        assert [top for top, _ in strips] == list(range(0, 50, strip_height))
+        assert np.array_equal(np.concatenate([strip for _, strip in strips]), pixels)
+
+
+def test_single_idat_png_is_inflated_one_strip_at_a_time(tmp_path):
+    pixels = np.zeros((2048, 2048, 3), dtype=np.uint8)    # 12 MB decoded, a few KB compressed
+    pixels[::5, ::3] = 255
+    cover = _single_idat_png(tmp_path / 'single.png', pixels)
+
+    with StripReader(cover, 16) as reader:
+        tracemalloc.start()
+        for top, strip in reader.strips():
+            assert np.array_equal(strip, pixels[top:top + 16])
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert peak < 2 * 1024 * 1024